@@ -0,0 +1,102 @@
+import os
+import gzip
+import json
+import lzma
+from typing import Iterable, Iterator
+from task import Task
+from locking import atomic_open
+
+
+ARCHIVE_AGE = 30  # Через сколько дней после выполнения задача уходит в архив
+
+
+class Archive:
+    """Сжатый архив выполненных задач.
+
+    Задачи дописываются строками Json в gzip (.gz) или lzma (.xz) файл.
+    Каждая дозапись - отдельный сжатый поток, оба формата читают такие
+    склеенные потоки как один файл, поэтому старые задачи не перепаковываются.
+    """
+
+    def __init__(self, filename: str, max_id_filename: str | None = None):
+        """
+        Args:
+            filename (str): Файл архива. Сжатие выбирается по расширению: .xz - lzma, иначе gzip
+            max_id_filename (str | None): Файл с наибольшим айди архива. По умолчанию - рядом с архивом, .id
+        """
+        self.filename = filename
+        self.opener = lzma.open if filename.endswith(".xz") else gzip.open
+        # Наибольший айди в архиве, чтобы айди заархивированных задач не выдавались повторно
+        self.max_id_filename = max_id_filename or os.path.splitext(filename)[0] + ".id"
+
+    def append(self, tasks: Iterable[Task]) -> int:
+        """Добавление задач в архив
+
+        Args:
+            tasks (Iterable[Task]): Задачи
+
+        Returns:
+            int: Количество добавленных задач
+        """
+        tasks = list(tasks)
+        lines = [json.dumps(task.to_dict(), ensure_ascii=False) + "\n" for task in tasks]
+        if not lines:
+            return 0
+        with open(self.filename, "ab") as raw:
+            with self.opener(raw, "wt", encoding="utf-8") as file:
+                file.write("".join(lines))
+            # Архив сбрасывается на диск до удаления задач из основного хранилища
+            raw.flush()
+            os.fsync(raw.fileno())
+        max_id = max(self.max_id(), max(task.task_id for task in tasks))
+        with atomic_open(self.max_id_filename) as file:
+            file.write(str(max_id))
+        return len(lines)
+
+    def max_id(self) -> int:
+        """Наибольший айди среди заархивированных задач
+
+        Returns:
+            int: Айди или 0, если архив пуст
+        """
+        try:
+            with open(self.max_id_filename, "r", encoding="utf-8") as file:
+                return int(file.read())
+        except (OSError, ValueError):
+            return 0
+
+    def iter_tasks(self) -> Iterator[Task]:
+        """Последовательное чтение задач архива в порядке архивации
+
+        Yields:
+            Task: Задача из архива
+        """
+        if not os.path.exists(self.filename):
+            return
+        with self.opener(self.filename, "rt", encoding="utf-8") as file:
+            for line in file:
+                yield Task.from_dict(json.loads(line))
+
+    def load(self) -> list[Task]:
+        """Все задачи архива в порядке айди. Повторно заархивированная задача берется последней версией
+
+        Returns:
+            list[Task]: Задачи архива
+        """
+        tasks = {task.task_id: task for task in self.iter_tasks()}
+        return [tasks[task_id] for task_id in sorted(tasks)]
+
+    def get(self, task_id: int) -> Task | None:
+        """Поиск задачи в архиве по айди
+
+        Args:
+            task_id (int): Айди задачи
+
+        Returns:
+            Task | None: Задача или None, если ее нет в архиве
+        """
+        found = None
+        for task in self.iter_tasks():
+            if task.task_id == task_id:
+                found = task
+        return found
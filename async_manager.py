@@ -0,0 +1,107 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from typing import AsyncIterator, Callable
+from task import Task
+from query import Query
+from task_manager import TaskManager
+
+
+CHUNK_SIZE = 500  # Сколько задач читается в потоке за один шаг ленивого обхода
+
+
+class AsyncTaskManager:
+    """Асинхронная обертка над TaskManager для использования внутри event loop.
+
+    Чтение и запись файлов выполняются в отдельном потоке, поэтому не
+    блокируют event loop. Поток один: TaskManager не рассчитан на
+    одновременные вызовы из нескольких потоков, а так вызовы выполняются
+    строго по очереди.
+    """
+
+    def __init__(self, manager: TaskManager, executor: ThreadPoolExecutor | None = None):
+        """
+        Args:
+            manager (TaskManager): Менеджер задач
+            executor (ThreadPoolExecutor | None): Поток для вызовов. По умолчанию создается новый
+        """
+        self.manager = manager
+        self.executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix="tasks")
+
+    @classmethod
+    async def open(cls, *args, **kwargs) -> "AsyncTaskManager":
+        """Создание TaskManager в потоке, загрузка задач не блокирует event loop
+
+        Args:
+            *args, **kwargs: Аргументы TaskManager
+
+        Returns:
+            AsyncTaskManager: Обертка над созданным менеджером
+        """
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tasks")
+        loop = asyncio.get_running_loop()
+        manager = await loop.run_in_executor(executor, partial(TaskManager, *args, **kwargs))
+        return cls(manager, executor)
+
+    async def run(self, function: Callable, *args, **kwargs):
+        """Вызов функции в потоке менеджера
+
+        Args:
+            function (Callable): Функция, обычно метод TaskManager
+            *args, **kwargs: Ее аргументы
+
+        Returns:
+            Результат функции
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(function, *args, **kwargs))
+
+    async def list_tasks(self, include_archived: bool = False, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[Task]:
+        """Ленивый обход задач: задачи читаются в потоке пачками по chunk_size
+
+        Args:
+            include_archived (bool): Добавить задачи из архива
+            chunk_size (int): Размер пачки
+
+        Yields:
+            Task: Очередная задача
+        """
+        tasks = await self.run(self.manager.list_tasks, include_archived)
+        while True:
+            chunk = await self.run(lambda: list(islice(tasks, chunk_size)))
+            if not chunk:
+                return
+            for task in chunk:
+                yield task
+
+    async def get_task_by_id(self, task_id: int, include_archived: bool = False) -> Task | None:
+        return await self.run(self.manager.get_task_by_id, task_id, include_archived)
+
+    async def get_tasks_by_category(self, category: str) -> list[Task]:
+        return await self.run(self.manager.get_tasks_by_category, category)
+
+    async def query(self, query: Query | None = None, include_archived: bool = False, **params) -> list[Task]:
+        return await self.run(self.manager.query, query, include_archived, **params)
+
+    async def search(self, text: str, limit: int | None = None) -> list[Task]:
+        return await self.run(self.manager.search, text, limit)
+
+    async def add_task(self, *args) -> Task:
+        return await self.run(self.manager.add_task, *args)
+
+    async def create_task(self, **fields) -> Task:
+        return await self.run(self.manager.create_task, **fields)
+
+    async def complete_task_by_id(self, task_id: int) -> Task | None:
+        return await self.run(self.manager.complete_task_by_id, task_id)
+
+    async def delete_task(self, task_id: int) -> Task | None:
+        return await self.run(self.manager.delete_task, task_id)
+
+    async def edit_tasks(self, fields: dict, ids=(), query: Query | None = None) -> tuple[list[Task], list[int]]:
+        return await self.run(self.manager.edit_tasks, fields, ids, query)
+
+    async def close(self) -> None:
+        """Завершение потока менеджера после выполнения уже отправленных вызовов"""
+        await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
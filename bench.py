@@ -0,0 +1,205 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import platform
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+from task import Task, CATEGORIES, PRIORITIES, STATUSES
+from task_manager import TaskManager
+from render import HEADER
+import render
+from storage import JsonStorage
+import utils
+
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+WORDS = [
+    "купить", "молоко", "хлеб", "отчет", "написать", "позвонить", "встреча",
+    "проект", "урок", "повторить", "убрать", "квартира", "оплатить", "счет",
+]
+OPERATIONS = [
+    "collect_tasks",
+    "collect_tasks_cached",
+    "save_tasks",
+    "add_task",
+    "get_task_by_id",
+    "get_tasks_by_category",
+    "complete_task_by_id",
+    "delete_task",
+    "pretty_print",
+    "render_tasks",
+]
+
+
+def generate_tasks(count: int, seed: int = 0) -> list[Task]:
+    """Генерация задач со случайными, но воспроизводимыми полями
+
+    Args:
+        count (int): Количество задач
+        seed (int): Зерно генератора случайных чисел
+
+    Returns:
+        list[Task]: Задачи с айди от 1 до count
+    """
+    rng = random.Random(seed)
+    start = date(2024, 1, 1)
+    return [
+        Task(
+            task_id=task_id,
+            title=" ".join(rng.choices(WORDS, k=2)),
+            description=" ".join(rng.choices(WORDS, k=rng.randint(0, 8))),
+            status=rng.choice(STATUSES),
+            priority=rng.choice(PRIORITIES),
+            category=rng.choice(CATEGORIES),
+            due_date=start + timedelta(days=rng.randint(0, 730)),
+        )
+        for task_id in range(1, count + 1)
+    ]
+
+
+def generate_file(filename: str, count: int, seed: int = 0) -> None:
+    """Создание tasks.json с count задачами
+
+    Args:
+        filename (str): Путь до файла
+        count (int): Количество задач
+        seed (int): Зерно генератора случайных чисел
+    """
+    JsonStorage(filename, cache=False).save(generate_tasks(count, seed))
+
+
+def measure(function, memory: bool) -> dict:
+    """Замер одного вызова. Вывод в консоль подавляется
+
+    Args:
+        function: Функция без аргументов
+        memory (bool): Считать пиковую память через tracemalloc
+
+    Returns:
+        dict: Время в секундах и пик памяти в байтах
+    """
+    if memory:
+        tracemalloc.start()
+    try:
+        with redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            function()
+            seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if memory else None
+    finally:
+        if memory:
+            tracemalloc.stop()
+    return {"seconds": seconds, "peak_bytes": peak}
+
+
+def bench_size(directory: str, count: int, seed: int, repeat: int) -> dict:
+    """Замеры всех операций на файле из count задач.
+
+    Каждая операция запускается repeat раз без tracemalloc, в результат идет
+    лучшее время. Пиковая память считается отдельным запуском, потому что
+    tracemalloc сильно замедляет код.
+
+    Args:
+        directory (str): Папка для файлов хранилища
+        count (int): Количество задач
+        seed (int): Зерно генератора случайных чисел
+        repeat (int): Количество повторов
+
+    Returns:
+        dict: Результаты по операциям
+    """
+    filename = os.path.join(directory, f"tasks-{count}.json")
+    started = time.perf_counter()
+    generate_file(filename, count, seed)
+    generate_seconds = time.perf_counter() - started
+    rng = random.Random(seed)
+
+    def load(cache: bool) -> TaskManager:
+        return TaskManager(storage=JsonStorage(filename, cache=cache))
+
+    manager = load(cache=True)
+    rows = [HEADER] + [render.task_cells(task) for task in manager.tasks]
+    # Айди для изменяющих операций берутся заранее, чтобы каждый запуск
+    # работал с существующей задачей
+    calls = repeat + 1
+    open_ids = [task.task_id for task in manager.tasks if task.status == "не выполнено"]
+    to_complete = iter(rng.sample(open_ids, min(len(open_ids), calls)))
+    to_delete = iter(rng.sample(range(1, count + 1), min(count, 2 * calls)))
+    operations = {
+        "collect_tasks": lambda: load(cache=False),
+        "collect_tasks_cached": lambda: load(cache=True),
+        "save_tasks": manager.save_tasks,
+        "add_task": lambda: manager.add_task("задача", "", "работа", "2024-11-29", "средний", "не выполнено"),
+        "get_task_by_id": lambda: manager.get_task_by_id(rng.randint(1, count)),
+        "get_tasks_by_category": lambda: manager.get_tasks_by_category(rng.choice(CATEGORIES)),
+        "complete_task_by_id": lambda: manager.complete_task_by_id(next(to_complete)),
+        "delete_task": lambda: manager.delete_task(next(to_delete)),
+        "pretty_print": lambda: utils.pretty_print(rows),
+        "render_tasks": lambda: render.render_tasks(manager.tasks),
+    }
+    results = {}
+    for name in OPERATIONS:
+        runs = [measure(operations[name], memory=False) for _ in range(repeat)]
+        results[name] = {
+            "seconds": min(run["seconds"] for run in runs),
+            "runs": [run["seconds"] for run in runs],
+            "peak_bytes": measure(operations[name], memory=True)["peak_bytes"],
+        }
+    return {
+        "tasks": count,
+        "file_bytes": os.path.getsize(filename),
+        "generate_seconds": generate_seconds,
+        "operations": results,
+    }
+
+
+def run(sizes: list[int], seed: int = 0, repeat: int = 3) -> dict:
+    """Запуск замеров для всех размеров
+
+    Args:
+        sizes (list[int]): Количества задач
+        seed (int): Зерно генератора случайных чисел
+        repeat (int): Количество повторов каждой операции
+
+    Returns:
+        dict: Результаты вместе с описанием окружения
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        return {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": seed,
+            "repeat": repeat,
+            "results": [bench_size(directory, count, seed, repeat) for count in sizes],
+        }
+
+
+def main(command_line=None):
+    parser = argparse.ArgumentParser(description="Замеры скорости и памяти TaskManager")
+    parser.add_argument("--sizes", "-n", type=int, nargs="+", default=DEFAULT_SIZES, help="Количество задач, например 1000 10000 1000000")
+    parser.add_argument("--seed", type=int, default=0, help="Зерно генератора задач")
+    parser.add_argument("--repeat", "-r", type=int, default=3, help="Сколько раз повторять каждую операцию")
+    parser.add_argument("--output", "-o", default=None, help="Файл для результатов. По умолчанию - stdout")
+    parser.add_argument("--generate", default=None, help="Только создать файл с задачами по этому пути")
+    args = parser.parse_args(command_line)
+
+    if args.generate:
+        generate_file(args.generate, args.sizes[0], args.seed)
+        return
+    results = run(args.sizes, args.seed, args.repeat)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, ensure_ascii=False, indent=4)
+    else:
+        json.dump(results, sys.stdout, ensure_ascii=False, indent=4)
+        print()
+
+
+if __name__ == "__main__":
+    main()
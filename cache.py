@@ -0,0 +1,128 @@
+import os
+import marshal
+import hashlib
+from typing import Iterable
+from task import Task
+from locking import atomic_open
+
+
+CACHE_VERSION = 2
+
+
+def file_digest(filename: str) -> str:
+    """Хеш содержимого файла
+
+    Args:
+        filename (str): Путь до файла
+
+    Returns:
+        str: Хеш blake2b в hex виде
+    """
+    with open(filename, "rb") as file:
+        return stream_digest(file)
+
+
+def stream_digest(file) -> str:
+    """Хеш содержимого открытого файла
+
+    Args:
+        file: Файл, открытый на чтение в бинарном режиме
+
+    Returns:
+        str: Хеш blake2b в hex виде
+    """
+    digest = hashlib.blake2b()
+    for chunk in iter(lambda: file.read(1024 * 1024), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SnapshotCache:
+    """Бинарный кеш разобранного Json снапшота.
+
+    Рядом с tasks.json хранится marshal файл с кортежами задач и отметкой
+    исходного файла (inode, mtime, размер, хеш). Пока отметка совпадает, задачи
+    читаются из кеша без разбора Json. Хеш считается только если inode, mtime или
+    размер изменились, чтобы не читать tasks.json на каждом запуске.
+    """
+
+    def __init__(self, source: str):
+        """
+        Args:
+            source (str): Json файл, для которого строится кеш
+        """
+        self.source = source
+        self.filename = os.path.splitext(source)[0] + ".cache"
+
+    def load(self) -> list[Task] | None:
+        """Загрузка задач из кеша
+
+        Returns:
+            list[Task] | None: Задачи или None, если кеша нет или он устарел
+        """
+        try:
+            with open(self.filename, "rb") as file:
+                version, inode, mtime_ns, size, digest = marshal.load(file)
+                if version != CACHE_VERSION:
+                    return None
+                stat = os.stat(self.source)
+                if (stat.st_ino, stat.st_mtime_ns, stat.st_size) == (inode, mtime_ns, size):
+                    rows = marshal.loads(file.read())
+                else:
+                    if stat.st_size != size:
+                        return None
+                    # Отметка берется с того же открытого файла, который хешируется
+                    with open(self.source, "rb") as source:
+                        stat = os.fstat(source.fileno())
+                        if stream_digest(source) != digest:
+                            return None
+                    data = file.read()
+                    rows = marshal.loads(data)
+                    # Содержимое то же, поменялась только отметка (touch, checkout). Заголовок
+                    # обновляется, иначе хеш считался бы заново при каждом запуске
+                    self.rewrite_header(stat, digest, data)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        return [Task.from_row(row) for row in rows]
+
+    def rewrite_header(self, stat: os.stat_result, digest: str, data: bytes) -> None:
+        """Перезапись отметки исходного файла без перестроения задач кеша
+
+        Args:
+            stat (os.stat_result): Новая отметка исходного файла
+            digest (str): Хеш его содержимого
+            data (bytes): Задачи кеша в виде marshal
+        """
+        header = (CACHE_VERSION, stat.st_ino, stat.st_mtime_ns, stat.st_size, digest)
+        try:
+            with atomic_open(self.filename, "wb") as file:
+                marshal.dump(header, file)
+                file.write(data)
+        except OSError:
+            # Кеш остается рабочим, просто хеш посчитается и в следующий раз
+            pass
+
+    def save(
+        self,
+        tasks: Iterable[Task],
+        stat: os.stat_result | None = None,
+        digest: str | None = None,
+    ) -> None:
+        """Перестроение кеша по только что сохраненному или прочитанному файлу
+
+        Args:
+            tasks (Iterable[Task]): Задачи, совпадающие с содержимым исходного файла
+            stat (os.stat_result | None): Отметка прочитанного файла. По умолчанию - текущая
+            digest (str | None): Хеш прочитанного содержимого. По умолчанию - хеш текущего файла
+        """
+        stat = stat or os.stat(self.source)
+        header = (
+            CACHE_VERSION,
+            stat.st_ino,
+            stat.st_mtime_ns,
+            stat.st_size,
+            digest or file_digest(self.source),
+        )
+        with atomic_open(self.filename, "wb") as file:
+            marshal.dump(header, file)
+            marshal.dump([task.to_row() for task in tasks], file)
@@ -0,0 +1,262 @@
+import os
+import json
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+from task import Task
+from locking import atomic_open
+from storage import Storage, RecordStorage, SqliteStorage
+
+
+CHUNK_SIZE = 1000  # Сколько изменений реплика применяет одной записью
+CHANGES_LIMIT = 16 * 1024 * 1024  # Размер ленты, после которого старая половина изменений удаляется
+
+
+class ChangeFeed:
+    """Лента изменений задач.
+
+    Каждое сохраненное изменение дописывается строкой Json с порядковым
+    номером: {"seq": 5, "op": "update", "task": {...}} или
+    {"seq": 6, "op": "delete", "task_id": 3}. Номера строго возрастают,
+    поэтому начало выборки since находится двоичным поиском по файлу, и
+    чтение стоит пропорционально количеству новых изменений, а не размеру
+    ленты или списка задач.
+
+    Лента не растет бесконечно: когда она больше limit, старые изменения
+    удаляются. Потребитель, отставший дальше начала ленты, делает полную копию.
+    """
+
+    def __init__(self, filename: str, limit: int = CHANGES_LIMIT):
+        """
+        Args:
+            filename (str): Файл ленты
+            limit (int): Размер ленты в байтах, после которого она обрезается до половины
+        """
+        self.filename = filename
+        self.limit = limit
+
+    @staticmethod
+    def _line_after(file, offset: int) -> tuple[int, bytes]:
+        """Первая полная строка, которая начинается не раньше offset"""
+        if offset > 0:
+            file.seek(offset - 1)
+            file.readline()
+        else:
+            file.seek(0)
+        start = file.tell()
+        line = file.readline()
+        return start, line if line.endswith(b"\n") else b""
+
+    @staticmethod
+    def _last_line(file) -> tuple[int, bytes]:
+        """Последняя строка файла. Ищется с конца блоками, без чтения всей ленты"""
+        end = file.seek(0, os.SEEK_END)
+        block = 4096
+        while True:
+            start = max(0, end - block)
+            file.seek(start)
+            data = file.read(end - start)
+            position = data.rfind(b"\n", 0, len(data) - 1)
+            if position >= 0 or start == 0:
+                return start + position + 1, data[position + 1:]
+            block *= 2
+
+    def last_seq(self) -> int:
+        """Номер последнего изменения
+
+        Returns:
+            int: Номер или 0, если лента пуста
+        """
+        try:
+            with open(self.filename, "rb") as file:
+                line = self._last_line(file)[1]
+        except FileNotFoundError:
+            return 0
+        return json.loads(line)["seq"] if line.strip() else 0
+
+    def first_seq(self) -> int:
+        """Номер первого изменения, которое есть в ленте
+
+        Returns:
+            int: Номер или last_seq() + 1, если лента пуста
+        """
+        try:
+            with open(self.filename, "rb") as file:
+                line = self._line_after(file, 0)[1]
+        except FileNotFoundError:
+            return 1
+        return json.loads(line)["seq"] if line else self.last_seq() + 1
+
+    @contextmanager
+    def record(self, changes: list[tuple[str, Task]]):
+        """Запись изменений в ленту вместе с сохранением их в хранилище.
+
+        Изменения дописываются до блока with, в котором они сохраняются в
+        хранилище. Если сохранение не удалось, записи убираются из ленты,
+        поэтому в ней не бывает изменений, которых нет в хранилище.
+        Вызывается под блокировкой хранилища.
+
+        Args:
+            changes (list[tuple[str, Task]]): Изменения - тип (add, update
+                или delete) и измененная задача
+        """
+        size = os.path.getsize(self.filename) if os.path.exists(self.filename) else 0
+        self.append(changes)
+        try:
+            yield
+        except BaseException:
+            with open(self.filename, "r+b") as file:
+                file.truncate(size)
+            raise
+        self.trim()
+
+    def trim(self) -> None:
+        """Удаление старых изменений, если лента больше limit. Остается последняя половина, но не меньше одной записи"""
+        if not os.path.exists(self.filename) or os.path.getsize(self.filename) <= self.limit:
+            return
+        with open(self.filename, "rb") as file:
+            size = file.seek(0, os.SEEK_END)
+            start = self._line_after(file, size - self.limit // 2)[0]
+            if start >= size:
+                start = self._last_line(file)[0]
+            file.seek(start)
+            data = file.read()
+        # Читатели, которые уже открыли ленту, дочитывают старый файл
+        with atomic_open(self.filename, "wb") as file:
+            file.write(data)
+
+    def append(self, changes: list[tuple[str, Task]]) -> int:
+        """Дописывание изменений в ленту. Вызывается под блокировкой хранилища
+
+        Args:
+            changes (list[tuple[str, Task]]): Изменения - тип (add, update
+                или delete) и измененная задача
+
+        Returns:
+            int: Номер последнего записанного изменения
+        """
+        seq = self.last_seq()
+        lines = []
+        for op, task in changes:
+            seq += 1
+            if op == "delete":
+                record = {"seq": seq, "op": op, "task_id": task.task_id}
+            else:
+                record = {"seq": seq, "op": op, "task": task.to_dict()}
+            lines.append(json.dumps(record, ensure_ascii=False) + "\n")
+        with open(self.filename, "a", encoding="utf-8") as file:
+            file.write("".join(lines))
+            file.flush()
+            os.fsync(file.fileno())
+        return seq
+
+    def since(self, seq: int = 0) -> Iterator[dict]:
+        """Изменения с номером больше seq в порядке номеров.
+
+        Недописанная последняя строка (запись идет прямо сейчас) пропускается,
+        поэтому читать ленту можно без блокировки.
+
+        Args:
+            seq (int): Номер последнего уже полученного изменения
+
+        Yields:
+            dict: Изменение - seq, op и task или task_id
+        """
+        try:
+            file = open(self.filename, "rb")
+        except FileNotFoundError:
+            return
+        with file:
+            low, high = 0, file.seek(0, os.SEEK_END)
+            while low < high:
+                middle = (low + high) // 2
+                line = self._line_after(file, middle)[1]
+                if not line or json.loads(line)["seq"] > seq:
+                    high = middle
+                else:
+                    low = middle + 1
+            file.seek(self._line_after(file, low)[0])
+            for line in file:
+                if not line.endswith(b"\n"):
+                    return
+                yield json.loads(line)
+
+
+class Replica:
+    """Копия задач только для чтения, которая догоняет основное хранилище по ленте изменений.
+
+    Реплика хранит задачи в RecordStorage (или SqliteStorage для файла .db),
+    поэтому применение изменения затрагивает только запись этой задачи.
+    Номер последнего примененного изменения лежит рядом в файле .seq.
+    Применение идемпотентно: если процесс упадет до записи номера, те же
+    изменения просто применятся повторно.
+    """
+
+    def __init__(self, filename: str):
+        """
+        Args:
+            filename (str): Файл реплики. .db - SQLite, иначе файл записей с индексом
+        """
+        self.filename = filename
+        self.seq_filename = os.path.splitext(filename)[0] + ".seq"
+        if filename.endswith(".db"):
+            self.storage: Storage = SqliteStorage(filename)
+        else:
+            self.storage = RecordStorage(filename)
+
+    def seq(self) -> int | None:
+        """Номер последнего примененного изменения
+
+        Returns:
+            int | None: Номер или None для новой реплики
+        """
+        try:
+            with open(self.seq_filename, "r", encoding="utf-8") as file:
+                return int(file.read())
+        except (OSError, ValueError):
+            return None
+
+    def set_seq(self, seq: int) -> None:
+        with atomic_open(self.seq_filename) as file:
+            file.write(str(seq))
+
+    def reset(self, tasks: Iterable[Task], seq: int) -> None:
+        """Полная перезапись реплики. Нужна, когда изменений до seq уже нет в ленте
+
+        Args:
+            tasks (Iterable[Task]): Все задачи на момент изменения seq
+            seq (int): Номер последнего изменения в ленте
+        """
+        with self.storage.lock():
+            self.storage.save(tasks)
+            self.set_seq(seq)
+
+    def apply(self, records: Iterable[dict]) -> int:
+        """Применение изменений из ChangeFeed.since пачками по CHUNK_SIZE
+
+        Args:
+            records (Iterable[dict]): Изменения
+
+        Returns:
+            int: Количество примененных изменений
+        """
+        applied = 0
+        changes = []
+        with self.storage.lock():
+            for record in records:
+                if record["op"] == "delete":
+                    # Для удаления хранилищу нужен только айди
+                    task = Task(record["task_id"], "")
+                else:
+                    task = Task.from_dict(record["task"])
+                changes.append((record["op"], task))
+                if len(changes) >= CHUNK_SIZE:
+                    applied += self._commit(changes, record["seq"])
+                    changes = []
+            if changes:
+                applied += self._commit(changes, record["seq"])
+        return applied
+
+    def _commit(self, changes: list[tuple[str, Task]], seq: int) -> int:
+        self.storage.commit((), changes)
+        self.set_seq(seq)
+        return len(changes)
@@ -0,0 +1,56 @@
+import os
+import json
+import socket
+
+
+SOCKET_PATH = "tasks.sock"
+
+
+def is_running(path: str = SOCKET_PATH) -> bool:
+    """Проверка, что сервер слушает сокет
+
+    Args:
+        path (str): Путь до Unix сокета сервера
+
+    Returns:
+        bool: True, если к сокету удалось подключиться
+    """
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        return False
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(1)
+            sock.connect(path)
+    except OSError:
+        return False
+    return True
+
+
+def forward(argv: list[str], path: str = SOCKET_PATH) -> str | None:
+    """Пересылка команды запущенному серверу
+
+    Args:
+        argv (list[str]): Аргументы командной строки
+        path (str): Путь до Unix сокета сервера
+
+    Returns:
+        str | None: Вывод команды или None, если сервер не запущен или
+            не может выполнить команду - тогда она выполняется локально
+    """
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(1)
+            sock.connect(path)
+            sock.settimeout(None)
+            sock.sendall((json.dumps({"argv": argv}) + "\n").encode("utf-8"))
+            with sock.makefile("rb") as reader:
+                line = reader.readline()
+    except OSError:
+        # Сокет остался от упавшего сервера
+        return None
+    if not line:
+        return None
+    response = json.loads(line)
+    return response["output"] if response["handled"] else None
@@ -0,0 +1,76 @@
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """Межпроцессная рекомендательная блокировка на отдельном lock файле.
+
+    Блокировка повторно входимая в пределах процесса: вложенные with
+    только увеличивают счетчик, файл блокируется один раз.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.file = None
+        self.depth = 0
+
+    def acquire(self) -> None:
+        if self.depth == 0:
+            self.file = open(self.filename, "a+b")
+            if fcntl:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+        self.depth += 1
+
+    def release(self) -> None:
+        self.depth -= 1
+        if self.depth == 0:
+            if fcntl:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+@contextmanager
+def atomic_open(filename: str, mode: str = "w"):
+    """Запись файла целиком через временный файл и os.replace.
+
+    Читатели видят либо старое, либо новое содержимое, но не наполовину
+    записанный файл. Если запись упала - старый файл остается нетронутым.
+
+    Args:
+        filename (str): Путь до файла
+        mode (str): Режим открытия временного файла - "w" или "wb"
+
+    Yields:
+        Открытый временный файл
+    """
+    temp_filename = f"{filename}.{os.getpid()}.tmp"
+    encoding = None if "b" in mode else "utf-8"
+    try:
+        with open(temp_filename, mode, encoding=encoding) as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_filename, filename)
+    finally:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
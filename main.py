@@ -1,19 +1,103 @@
+import time
+
+# Начало импорта модулей, для фазы import в --profile
+STARTED = time.perf_counter()
+
+import os
+import sys
+import json
 import argparse
+from itertools import islice
+from contextlib import nullcontext
+import client
+import profiling
+import transfer
+import render
+import utils
 from task_manager import TaskManager
-from datetime import datetime
+from storage import JsonStorage, SqliteStorage, RecordStorage, ShardedStorage
+from query import Query, parse_where
+from typing import Iterable
+from task import Task, CATEGORIES, PRIORITIES, STATUSES
+from archive import ARCHIVE_AGE
+from changes import Replica
+
+
+PAGE_SIZE = 20
+REPLICA_FILE = "tasks.replica.records"
+# Флаги, от которых зависит, какое хранилище и как записывается
+STORAGE_OPTIONS = ("storage", "compress", "shard_by")
+WHERE_HELP = (
+    'Фильтр задач через запятую: category=работа, status=не выполнено|в процессе, '
+    'priority=высокий, due>=2024-11-01, due<=2024-11-30, overdue, due-within=7'
+)
+
 
+def build_parser() -> argparse.ArgumentParser:
+    """Построение парсера аргументов командной строки
 
-def main(command_line=None):
+    Returns:
+        argparse.ArgumentParser: Парсер со всеми командами
+    """
     parser = argparse.ArgumentParser(
         prog="Список задач", description="Управление вашим списком задач"
     )
     parser.add_argument("--debug", action="store_true", help="Print debug info")
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=profiling.METRICS_FILE,
+        default=None,
+        metavar="FILE",
+        help=f"Замерить время по фазам и дописать его в файл метрик (по умолчанию {profiling.METRICS_FILE})",
+    )
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="Вместе с --profile считать память через tracemalloc. Команда выполняется в несколько раз медленнее",
+    )
+    parser.add_argument(
+        "--storage",
+        choices=["json", "journal", "sqlite", "records", "sharded"],
+        default="json",
+        help="Хранилище задач: tasks.json, tasks.json с журналом изменений, tasks.db, "
+        "tasks.records с индексом айди или шарды в tasks.shards",
+    )
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        help="Сжимать tasks.json gzip при записи. Сжатый и обычный файл читаются одинаково",
+    )
+    parser.add_argument(
+        "--shard-by",
+        default="category",
+        help="Поля разбиения на шарды через запятую: category, month или category,month. "
+        "Учитывается при создании tasks.shards",
+    )
     subparser = parser.add_subparsers(dest="command")
 
     # Вывод данных
     list_parser = subparser.add_parser("list", help="Вывод всех задач")
     list_parser.add_argument('-id', type=int, help='Вывод по айдишнику', default=None)
-    list_parser.add_argument('--category','-c', type=str, help='Вывод по категориям', default=None)
+    list_parser.add_argument('--include-archived', '-a', action='store_true', help='Искать и среди задач из архива')
+    list_parser.add_argument('--category','-c', type=str, action='append', help='Вывод по категориям. Можно указать несколько раз', default=None)
+    list_parser.add_argument('--status', '-s', action='append', help='Фильтр по статусу. Можно указать несколько раз', default=None)
+    list_parser.add_argument('--priority', '-p', action='append', help='Фильтр по приоритету. Можно указать несколько раз', default=None)
+    list_parser.add_argument('--due-from', help='Дедлайн не раньше, год-месяц-день', default=None)
+    list_parser.add_argument('--due-to', help='Дедлайн не позже, год-месяц-день', default=None)
+    list_parser.add_argument(
+        '--sort',
+        help='Сортировка через запятую: id, title, category, priority, status, due_date. "-" в начале - по убыванию, '
+        'значение тогда пишется через "=": --sort=-priority,due_date',
+        default=None,
+    )
+    list_parser.add_argument('--overdue', action='store_true', help='Невыполненные задачи с прошедшим дедлайном')
+    list_parser.add_argument('--due-within', type=utils.non_negative_int, help='Невыполненные задачи с дедлайном в ближайшие N дней', default=None)
+    list_parser.add_argument('--limit', type=utils.non_negative_int, help='Максимальное количество задач', default=None)
+    list_parser.add_argument('--offset', type=utils.non_negative_int, help='Сколько задач пропустить', default=0)
+    list_parser.add_argument('--page', type=utils.positive_int, help=f'Номер страницы, размер страницы - --limit (по умолчанию {PAGE_SIZE})', default=None)
+    list_parser.add_argument('--after', type=int, help='Курсор: задачи с айди больше указанного', default=None)
+    list_parser.add_argument('--format', '-f', choices=render.FORMATS, default='table', help='Формат вывода: таблица, текст через табуляцию, CSV или JSONL')
 
     # Ввод данных
     add_parser = subparser.add_parser("add", help="Добавление задачи в список задач")
@@ -30,21 +114,21 @@ def main(command_line=None):
         "--status",
         "-s",
         help="Статус задачи. По умолчанию - не выполнено",
-        choices=["не выполнено", "в процессе", "выполнено"],
+        choices=STATUSES,
         default="не выполнено",
     )
     add_parser.add_argument(
         "--priority",
         "-p",
         help="Приоритет задачи. По умолчанию - низкий",
-        choices=["низкий", "средний", "высокий"],
+        choices=PRIORITIES,
         default="низкий",
     )
     add_parser.add_argument(
         "--category",
         "-c",
         help="Категория задачи. По умолчанию - личное",
-        choices=["обучение", "личное", "работа", "дом"],
+        choices=CATEGORIES,
         default="личное",
     )
     add_parser.add_argument(
@@ -56,64 +140,430 @@ def main(command_line=None):
 
     # Завершить задачу
     complete_parser = subparser.add_parser('complete', help='Завершить задачу')
-    complete_parser.add_argument('-id', help='Айди задачи, которую нужно завершить', type=int)
+    complete_parser.add_argument('-id', help='Айди задач, которые нужно завершить: 3 или 1,2,5-9', type=utils.parse_ids)
+    complete_parser.add_argument('--where', '-w', help=WHERE_HELP, default=None)
     
     # Редактироваение данных 
-    edit_parser = subparser.add_parser('edit', help='Изменение задачи')
-    edit_parser.add_argument('-id', type=int, help='Айди задачи, которую нужно изменить')
+    edit_parser = subparser.add_parser('edit', help='Изменение задачи. Без флагов полей - в диалоге')
+    edit_parser.add_argument('-id', type=utils.parse_ids, help='Айди задач, которые нужно изменить: 3 или 1,2,5-9')
+    edit_parser.add_argument('--where', '-w', help=WHERE_HELP, default=None)
+    edit_parser.add_argument('--title', '-t', help='Новое название', default=None)
+    edit_parser.add_argument('--description', '-d', help='Новое описание', default=None)
+    edit_parser.add_argument('--deadline', '-dl', help='Новый дедлайн год-месяц-день', default=None)
+    edit_parser.add_argument('--category', '-c', choices=CATEGORIES, help='Новая категория', default=None)
+    edit_parser.add_argument('--priority', '-p', choices=PRIORITIES, help='Новый приоритет', default=None)
+    edit_parser.add_argument('--status', '-s', choices=STATUSES, help='Новый статус', default=None)
     
     # Удаление задачи
     delete_parser = subparser.add_parser('del', help='Удалить задачу')
-    delete_parser.add_argument('-id', type=int, help='Айди задачи, которую нужно удалить ')
+    delete_parser.add_argument('-id', type=utils.parse_ids, help='Айди задач, которые нужно удалить: 3 или 1,2,5-9')
+    delete_parser.add_argument('--where', '-w', help=WHERE_HELP, default=None)
     
-    manager = TaskManager()
+    # Архив выполненных задач
+    archive_parser = subparser.add_parser('archive', help='Перенести давно выполненные задачи в архив')
+    archive_parser.add_argument('--days', type=utils.non_negative_int, default=ARCHIVE_AGE, help=f'Сколько дней после выполнения задача остается среди активных, по умолчанию {ARCHIVE_AGE}')
+
+    # Лента изменений и реплика
+    changes_parser = subparser.add_parser('changes', help='Вывод изменений задач строками JSON')
+    changes_parser.add_argument('--since', type=utils.non_negative_int, default=0, help='Номер последнего уже полученного изменения')
+    changes_parser.add_argument('--limit', type=utils.non_negative_int, help='Максимальное количество изменений', default=None)
+    replicate_parser = subparser.add_parser('replicate', help='Перенести новые изменения в реплику')
+    replicate_parser.add_argument('path', nargs='?', default=REPLICA_FILE, help=f'Файл реплики: .records или .db, по умолчанию {REPLICA_FILE}')
+
+    # Импорт и экспорт
+    import_parser = subparser.add_parser('import', help='Импорт задач из JSONL или CSV файла')
+    import_parser.add_argument('path', help='Путь до файла')
+    import_parser.add_argument('--format', '-f', choices=transfer.FORMATS, help='Формат файла. По умолчанию - по расширению', default=None)
+    export_parser = subparser.add_parser('export', help='Экспорт задач в JSONL или CSV файл')
+    export_parser.add_argument('path', help='Путь до файла')
+    export_parser.add_argument('--format', '-f', choices=transfer.FORMATS, help='Формат файла. По умолчанию - по расширению', default=None)
+
+    # Поиск
+    search_parser = subparser.add_parser('search', help='Поиск задач по словам из названия и описания')
+    search_parser.add_argument('text', help='Слова для поиска, можно указывать начало слова')
+    search_parser.add_argument('--limit', type=utils.non_negative_int, help='Максимальное количество задач', default=None)
+
+    # Запуск сервера
+    subparser.add_parser(
+        'serve', help='Запустить сервер, который держит задачи в памяти между командами'
+    )
+
+    # Названия команд нужны, чтобы "--profile list" не принимал list за файл метрик
+    parser.commands = set(subparser.choices)
+    return parser
+
+
+def create_manager(args, lazy: bool = False, hooks=()) -> TaskManager:
+    """Создание TaskManager с выбранным хранилищем
+
+    Args:
+        args (argparse.Namespace): Аргументы командной строки
+        lazy (bool): Не загружать задачи целиком при создании
+        hooks (Iterable[profiling.Hook]): Подписчики на замеры фаз
+
+    Returns:
+        TaskManager: Менеджер задач
+    """
+    if args.storage == "sqlite":
+        return TaskManager(storage=SqliteStorage("tasks.db", source="tasks.json"), hooks=hooks)
+    if args.storage == "records":
+        return TaskManager(storage=RecordStorage("tasks.records", source="tasks.json"), hooks=hooks)
+    if args.storage == "sharded":
+        storage = ShardedStorage("tasks.shards", partition=args.shard_by.split(","), source="tasks.json")
+        return TaskManager(storage=storage, lazy=lazy, hooks=hooks)
+    storage = JsonStorage("tasks.json", journal=args.storage == "journal", compress=args.compress)
+    return TaskManager(storage=storage, lazy=lazy, hooks=hooks)
+
+
+def main(command_line=None, manager: TaskManager | None = None):
+    """Запуск команды.
+
+    Если запущен сервер (python main.py serve), команда пересылается ему,
+    иначе выполняется в текущем процессе.
+
+    Args:
+        command_line (list[str] | None): Аргументы. По умолчанию - sys.argv
+        manager (TaskManager | None): Уже созданный менеджер задач, команда
+            выполняется на нем без пересылки серверу
+    """
+    argv = command_line if command_line is not None else sys.argv[1:]
+    profiler = None
+    memory = "--profile-memory" in argv
+    if memory or "--profile" in argv or any(arg.startswith("--profile=") for arg in argv):
+        profiler = profiling.Profiler(STARTED if command_line is None else None, memory=memory)
+    with profiling.measure("argparse", profiler.record) if profiler else nullcontext():
+        parser = build_parser()
+        argv = [
+            f"--profile={profiling.METRICS_FILE}" if arg == "--profile" and following in parser.commands else arg
+            for arg, following in zip(argv, argv[1:] + [None])
+        ]
+        args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        serve(parser, args)
+        return
+
+    hooks = [profiler.record] if profiler else []
+    if manager is None:
+        # edit без флагов полей спрашивает пользователя через input(), поэтому выполняется локально.
+        # При --profile замеряется работа текущего процесса, поэтому команда тоже не пересылается
+        if not is_interactive(args) and not profiler:
+            output = client.forward(argv)
+            if output is not None:
+                print(output, end="")
+                return
+        # Команды на чтение не загружают файл целиком, а читают его потоково
+        manager = create_manager(args, lazy=args.command in ("list", "export", "changes", "replicate"), hooks=hooks)
+    else:
+        for hook in hooks:
+            manager.subscribe(hook)
+
+    run_command(manager, args)
+
+    if profiler:
+        metrics = profiler.finish(argv)
+        profiling.Profiler.write(metrics, args.profile or profiling.METRICS_FILE)
+        print(profiling.Profiler.format(metrics), file=sys.stderr)
+        if hooks:
+            manager.hooks.remove(profiler.record)
+
+
+def is_interactive(args) -> bool:
+    """Проверка, что команда будет спрашивать пользователя через input()
+
+    Args:
+        args (argparse.Namespace): Аргументы командной строки
+
+    Returns:
+        bool: True для edit без новых значений полей
+    """
+    if args.command != "edit":
+        return False
+    return all(
+        getattr(args, field) is None
+        for field in ("title", "description", "deadline", "category", "priority", "status")
+    )
+
+
+def storage_options(args) -> tuple:
+    """Значения флагов хранилища. Сервер выполняет только команды с теми же флагами, что у него
+
+    Args:
+        args (argparse.Namespace): Аргументы командной строки
+
+    Returns:
+        tuple: Значения STORAGE_OPTIONS
+    """
+    return tuple(getattr(args, option) for option in STORAGE_OPTIONS)
 
-    args = parser.parse_args(command_line)
 
+def serve(parser: argparse.ArgumentParser, args) -> None:
+    """Запуск сервера с одним TaskManager, который живет между командами
+
+    Args:
+        parser (argparse.ArgumentParser): Парсер аргументов
+        args (argparse.Namespace): Аргументы, с которыми запущен сервер
+    """
+    import server
+
+    manager = create_manager(args)
+    # Изменения копятся в памяти и сохраняются групповой записью после каждого окна
+    manager.begin_batch()
+
+    def handle(argv: list[str]) -> bool:
+        request = parser.parse_args(argv)
+        # Команда с другими флагами хранилища выполняется клиентом локально, иначе флаги бы молча игнорировались
+        if storage_options(request) != storage_options(args) or request.command == "serve" or is_interactive(request):
+            return False
+        # Файл мог измениться локальной командой, пока сервер работал
+        manager.refresh()
+        run_command(manager, request)
+        return True
+
+    server.serve(
+        handle,
+        group_commit=server.GroupCommit(manager.flush, lambda: bool(manager.pending)),
+    )
+
+
+def run_command(manager: TaskManager, args) -> None:
+    """Выполнение разобранной команды на менеджере задач
+
+    Args:
+        manager (TaskManager): Менеджер задач
+        args (argparse.Namespace): Аргументы командной строки
+    """
     if args.debug:
         print("debug" + str(args))
 
     if args.command == "list":
+        output_format = args.format
         if args.id:
-            manager.get_task_by_id(args.id)
-        elif args.category:
-            manager.get_tasks_by_category(args.category)
+            task = manager.get_task_by_id(args.id, include_archived=args.include_archived)
+            if task is None:
+                print(f"Задача с ID{args.id} не найдена.")
+            else:
+                print_tasks(manager, [task], output_format=output_format)
+        elif args.overdue:
+            print_tasks(manager, manager.overdue_tasks(), output_format=output_format)
+        elif args.due_within is not None:
+            print_tasks(manager, manager.upcoming_tasks(args.due_within), output_format=output_format)
+        elif any(
+            [args.category, args.status, args.priority, args.due_from, args.due_to, args.sort, args.limit, args.offset,
+             args.page, args.after is not None]
+        ):
+            limit, offset = args.limit, args.offset
+            if args.page:
+                limit = limit or PAGE_SIZE
+                offset += (args.page - 1) * limit
+            try:
+                query = Query(
+                    category=args.category,
+                    status=args.status,
+                    priority=args.priority,
+                    due_from=args.due_from,
+                    due_to=args.due_to,
+                    sort=args.sort.split(",") if args.sort else None,
+                    limit=limit,
+                    offset=offset,
+                    after=args.after,
+                )
+            except ValueError as error:
+                print(error)
+                return
+            tasks = manager.query(query, include_archived=args.include_archived)
+            print_tasks(manager, tasks, output_format=output_format)
+            # Курсор на следующую страницу имеет смысл только при выводе по порядку айди
+            if output_format == "table" and limit and len(tasks) == limit and query.sort in ([], ["id"]):
+                print(f"Следующая страница: --after {tasks[-1].task_id}")
+            if args.debug:
+                print(f"debug plan={query.plan}")
         else:
-            manager.list_tasks()
+            print_tasks(manager, manager.list_tasks(include_archived=args.include_archived), "[]", output_format)
         
     if args.command == "add":
-        try:
-            if bool(datetime.strptime(args.deadline, '%Y-%m-%d')):
-                
-                if args.title:
-                    manager.add_task(
-                        title=args.title,
-                        description=args.description,
-                        category=args.category,
-                        due_date=args.deadline,
-                        priority=args.priority,
-                        status=args.status,
-                    )
-                else:
-                    print('Для создания задачи небходимо указать "--title"')
-        except ValueError:
-            print('Дату необходимо указывать в формате год-месяц-день')
-        
-        
-            
+        error = utils.validate_task_fields(
+            args.title, args.category, args.deadline, args.priority, args.status
+        )
+        if error:
+            print(error)
+        else:
+            task = manager.add_task(
+                title=args.title,
+                description=args.description,
+                category=args.category,
+                due_date=args.deadline,
+                priority=args.priority,
+                status=args.status,
+            )
+            print(f'Задача "{task.title}" успешно создана')
+
+    if args.command == "import":
+        report = transfer.import_tasks(manager, args.path, args.format)
+        for line, error in report.errors:
+            print(f"Строка {line}: {error}")
+        print(
+            f"Импортировано задач: {report.imported}, с ошибками: {len(report.errors)}, "
+            f"{report.seconds:.2f} с ({report.rate:.0f} задач/с)"
+        )
+
+    if args.command == "export":
+        count = transfer.export_tasks(manager, args.path, args.format)
+        print(f"Экспортировано задач: {count}")
+
+    if args.command == "archive":
+        tasks = manager.archive_tasks(args.days)
+        print(f"Перенесено в архив задач: {len(tasks)}")
+
+    if args.command == "changes":
+        first = manager.changes.first_seq()
+        if args.since < first - 1:
+            print(
+                f"Изменений после {args.since} уже нет в ленте, она начинается с {first}. "
+                "Нужна полная копия: export или replicate",
+                file=sys.stderr,
+            )
+            return
+        for record in islice(manager.changes_since(args.since), args.limit):
+            print(json.dumps(record, ensure_ascii=False))
+
+    if args.command == "replicate":
+        replica = Replica(args.path)
+        count = manager.replicate(replica)
+        print(f"Перенесено в реплику: {count}, номер последнего изменения: {replica.seq()}")
+
+    if args.command == 'search':
+        print_tasks(manager, manager.search(args.text, limit=args.limit))
+
+    if args.command in ('edit', 'del', 'complete'):
+        run_batch_command(manager, args)
+
+
+def print_tasks(
+    manager: TaskManager,
+    tasks: Iterable[Task],
+    empty_message: str = "Ничего не найдено.",
+    output_format: str = "table",
+) -> int:
+    """Потоковый вывод задач. Весь вывод задач в консоль идет через эту функцию
+
+    Args:
+        manager (TaskManager): Менеджер задач, для замера фазы render
+        tasks (Iterable[Task]): Задачи
+        empty_message (str): Что вывести, если задач нет (только для таблицы)
+        output_format (str): Формат вывода из render.FORMATS
+
+    Returns:
+        int: Количество выведенных задач
+    """
+    with manager.phase("render"):
+        count = render.render_tasks(tasks, output_format)
+    if not count and output_format == "table":
+        print(empty_message)
+    return count
+
+
+EDIT_MENU = """Что изменяем? 
+1 - Название
+2 - Описание
+3 - Дедлайн
+4 - Категория
+5 - Приоритет
+6 - Статус выполнения
+7 - Всю задачу
+8 - Отмена
+Введите: """
+
+
+def edit_interactive(manager: TaskManager, task_id: int) -> None:
+    """Изменение задачи с вопросами пользователю
+
+    Args:
+        manager (TaskManager): Менеджер задач
+        task_id (int): Айди задачи, которая будет изменена
+    """
+    def ask(task: Task) -> Task | None:
+        user_choice = input(EDIT_MENU)
+        return utils.answer_user_edit_info(task, int(user_choice))
+
+    task = manager.edit_task(task_id, ask)
+    if task is not None:
+        print(f"Задача '{task.title}' успешно изменена.")
+
+
+def run_batch_command(manager: TaskManager, args) -> None:
+    """Выполнение complete, del и edit для одной или нескольких задач
+
+    Args:
+        manager (TaskManager): Менеджер задач
+        args (argparse.Namespace): Аргументы командной строки
+    """
+    fields = {}
     if args.command == 'edit':
-        if args.id:
-            manager.edit_task(args.id)
-        
-    if args.command == 'del':
-        if args.id:
-            manager.delete_task(args.id)
-        
-    if args.command == 'complete':
-        if args.id:
-            manager.complete_task_by_id(args.id)
+        fields = {
+            field: value
+            for field, value in (
+                ('title', args.title),
+                ('description', args.description),
+                ('due_date', args.deadline),
+                ('category', args.category and args.category.lower()),
+                ('priority', args.priority),
+                ('status', args.status),
+            )
+            if value is not None
+        }
+        error = utils.validate_edit_fields(fields)
+        if error:
+            print(error)
+            return
+
+    ids = args.id or []
+    # Одна задача без фильтра - как раньше, с выводом по одной задаче
+    if len(ids) == 1 and not args.where and not fields:
+        task = manager.find_task(ids[0])
+        if task is None:
+            print(f"Задача с ID {ids[0]} не найдена.")
+        elif args.command == 'edit':
+            edit_interactive(manager, task.task_id)
+        elif args.command == 'del':
+            manager.delete_task(task.task_id)
+            print(f"Задача {task.title} удалена")
         else:
-            print('Необходимо указать ID задачи, которую нужно завершить.')
+            completed = manager.complete_task_by_id(task.task_id)
+            if completed is None:
+                print("Задача уже выполнена.")
+            else:
+                print_tasks(manager, [completed])
+        return
+
+    if not ids and not args.where:
+        print('Необходимо указать ID задачи или фильтр --where.')
+        return
+    if args.command == 'edit' and not fields:
+        print('Для изменения нескольких задач укажите новые значения полей, например --status выполнено.')
+        return
+    try:
+        query = parse_where(args.where) if args.where else None
+    except ValueError as error:
+        print(error)
+        return
+
+    if args.command == 'edit':
+        tasks, missing = manager.edit_tasks(fields, ids, query)
+        print_tasks(manager, tasks, 'Нет задач для изменения.')
+    elif args.command == 'del':
+        tasks, missing = manager.delete_tasks(ids, query)
+        print(f'Удалено задач: {len(tasks)}')
+    else:
+        tasks, missing = manager.complete_tasks(ids, query)
+        print_tasks(manager, tasks, 'Нет задач для завершения.')
+    if missing:
+        print(f'Задачи с ID {", ".join(map(str, missing))} не найдены.')
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    except BrokenPipeError:
+        # Вывод закрыли раньше времени, например list | head
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
@@ -0,0 +1,160 @@
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Iterable, Iterator
+
+
+METRICS_FILE = "metrics.jsonl"
+
+# Подписчик получает название фазы, время в секундах и прирост памяти в байтах.
+# Прирост памяти - None, если tracemalloc не запущен
+Hook = Callable[[str, float, int | None], None]
+
+
+@contextmanager
+def measure(name: str, callback: Hook):
+    """Замер времени и прироста памяти блока with
+
+    Args:
+        name (str): Название фазы
+        callback (Hook): Кому передать результат
+    """
+    tracing = tracemalloc.is_tracing()
+    before = tracemalloc.get_traced_memory()[0] if tracing else 0
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        allocated = tracemalloc.get_traced_memory()[0] - before if tracing else None
+        callback(name, seconds, allocated)
+
+
+def measure_iter(name: str, items: Iterable, callback: Hook) -> Iterator:
+    """Замер времени и памяти, потраченных на получение элементов потока.
+
+    Время обработки элементов у потребителя (например, вывод) не входит в
+    замер. Результат передается один раз, когда поток закончился или закрыт.
+
+    Args:
+        name (str): Название фазы
+        items (Iterable): Поток элементов
+        callback (Hook): Кому передать результат
+    """
+    iterator = iter(items)
+    tracing = tracemalloc.is_tracing()
+    seconds = 0.0
+    allocated = 0 if tracing else None
+    try:
+        while True:
+            before = tracemalloc.get_traced_memory()[0] if tracing else 0
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                seconds += time.perf_counter() - started
+                if tracing:
+                    allocated += tracemalloc.get_traced_memory()[0] - before
+            yield item
+    finally:
+        callback(name, seconds, allocated)
+
+
+class Profiler:
+    """Сбор времени и памяти по фазам выполнения одной команды.
+
+    Повторные фазы (например, несколько сохранений) суммируются. Память
+    считается только по запросу: tracemalloc замедляет код в несколько раз,
+    и время в таком запуске уже не соответствует обычному.
+    """
+
+    def __init__(self, started: float | None = None, memory: bool = False):
+        """
+        Args:
+            started (float | None): perf_counter() в начале импорта модулей.
+                Если задан, импорт записывается отдельной фазой
+            memory (bool): Считать прирост и пик памяти через tracemalloc
+        """
+        self.phases: dict[str, dict] = {}
+        self.memory = memory
+        self.started = time.perf_counter()
+        self.origin = self.started if started is None else started
+        if started is not None:
+            self.record("import", self.started - started, None)
+        if memory:
+            tracemalloc.start()
+
+    def record(self, name: str, seconds: float, allocated: int | None) -> None:
+        """Добавление замера фазы. Подходит как подписчик TaskManager.subscribe
+
+        Args:
+            name (str): Название фазы
+            seconds (float): Время в секундах
+            allocated (int | None): Прирост памяти в байтах
+        """
+        phase = self.phases.setdefault(name, {"seconds": 0.0, "allocated": None, "calls": 0})
+        phase["seconds"] += seconds
+        phase["calls"] += 1
+        if allocated is not None:
+            phase["allocated"] = (phase["allocated"] or 0) + allocated
+
+    def phase(self, name: str):
+        """Замер фазы блоком with
+
+        Args:
+            name (str): Название фазы
+        """
+        return measure(name, self.record)
+
+    def finish(self, command: list[str]) -> dict:
+        """Остановка замеров
+
+        Args:
+            command (list[str]): Аргументы команды
+
+        Returns:
+            dict: Результаты для записи в файл метрик
+        """
+        peak = None
+        if self.memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "command": command,
+            "seconds": time.perf_counter() - self.origin,
+            "peak_bytes": peak,
+            "phases": self.phases,
+        }
+
+    @staticmethod
+    def write(metrics: dict, filename: str = METRICS_FILE) -> None:
+        """Дописывание результатов одной строкой Json в файл метрик
+
+        Args:
+            metrics (dict): Результаты из finish
+            filename (str): Файл метрик
+        """
+        with open(filename, "a", encoding="utf-8") as file:
+            file.write(json.dumps(metrics, ensure_ascii=False) + "\n")
+
+    @staticmethod
+    def format(metrics: dict) -> str:
+        """Краткий отчет по фазам для вывода в консоль
+
+        Args:
+            metrics (dict): Результаты из finish
+
+        Returns:
+            str: Отчет
+        """
+        peak = "" if metrics["peak_bytes"] is None else f", пик памяти {metrics['peak_bytes'] / 1024:.0f} КБ"
+        lines = [f"Всего: {metrics['seconds'] * 1000:.1f} мс{peak}"]
+        for name, phase in metrics["phases"].items():
+            allocated = "" if phase["allocated"] is None else f", {phase['allocated'] / 1024:+.0f} КБ"
+            lines.append(f"  {name}: {phase['seconds'] * 1000:.1f} мс{allocated}")
+        return "\n".join(lines)
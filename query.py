@@ -0,0 +1,212 @@
+import bisect
+import heapq
+from datetime import date, timedelta
+from itertools import islice
+from typing import Iterable
+from task import Task, OPEN_STATUSES, date_to_ordinal
+
+
+SORT_KEYS = {
+    "id": lambda task: task.task_id,
+    "title": lambda task: task.title,
+    "category": lambda task: task.category,
+    "priority": lambda task: task.priority_code,
+    "status": lambda task: task.status_code,
+    "due_date": lambda task: (task.due_ordinal is None, task.due_ordinal or 0),
+}
+FILTER_FIELDS = ("category", "status", "priority")
+
+
+class Query:
+    """Запрос к списку задач: фильтры, сортировка и постраничный вывод.
+
+    Фильтры по одному полю объединяются через ИЛИ, по разным полям - через И.
+    """
+
+    def __init__(
+        self,
+        category: Iterable[str] | None = None,
+        status: Iterable[str] | None = None,
+        priority: Iterable[str] | None = None,
+        due_from: str | None = None,
+        due_to: str | None = None,
+        sort: Iterable[str] | None = None,
+        limit: int | None = None,
+        offset: int = 0,
+        after: int | None = None,
+    ):
+        """
+        Args:
+            category (Iterable[str] | None): Допустимые категории
+            status (Iterable[str] | None): Допустимые статусы
+            priority (Iterable[str] | None): Допустимые приоритеты
+            due_from (str | None): Дедлайн не раньше, год-месяц-день
+            due_to (str | None): Дедлайн не позже, год-месяц-день
+            sort (Iterable[str] | None): Ключи сортировки из SORT_KEYS, "-" в начале - по убыванию
+            limit (int | None): Максимальное количество задач
+            offset (int): Сколько задач пропустить с начала
+            after (int | None): Курсор постраничного вывода - только задачи с айди больше after
+        """
+        self.filters = {
+            "category": {value.lower() for value in category} if category else None,
+            "status": {value.lower() for value in status} if status else None,
+            "priority": {value.lower() for value in priority} if priority else None,
+        }
+        self.due_from = date_to_ordinal(due_from)
+        self.due_to = date_to_ordinal(due_to)
+        self.sort = list(sort or [])
+        for key in self.sort:
+            if key.lstrip("-") not in SORT_KEYS:
+                raise ValueError(f"Неизвестный ключ сортировки: {key}")
+        self.limit = limit
+        self.offset = offset
+        self.after = after
+        self.plan = None
+
+    def matches(self, task: Task) -> bool:
+        """Проверка задачи на соответствие всем фильтрам
+
+        Args:
+            task (Task): Задача
+
+        Returns:
+            bool: True, если задача подходит
+        """
+        if self.after is not None and task.task_id <= self.after:
+            return False
+        for field, values in self.filters.items():
+            if values is not None and getattr(task, field) not in values:
+                return False
+        if self.due_from is not None or self.due_to is not None:
+            if task.due_ordinal is None:
+                return False
+            if self.due_from is not None and task.due_ordinal < self.due_from:
+                return False
+            if self.due_to is not None and task.due_ordinal > self.due_to:
+                return False
+        return True
+
+    def choose_index(
+        self,
+        indexes: dict[str, dict[str, set[int]]],
+        deadlines: list[tuple[int, int]] | None = None,
+    ) -> set[int] | None:
+        """Выбор самого селективного индекса для фильтров запроса
+
+        Args:
+            indexes (dict[str, dict[str, set[int]]]): Индексы TaskManager - поле, значение, айди задач
+            deadlines (list[tuple[int, int]] | None): Отсортированные (дедлайн, айди) невыполненных задач
+
+        Returns:
+            set[int] | None: Айди задач-кандидатов или None, если подходящего индекса нет
+        """
+        best = None
+        statuses = self.filters["status"]
+        # Индекс дедлайнов содержит только невыполненные задачи, поэтому
+        # подходит, только если запрос и так исключает выполненные
+        if (
+            deadlines is not None
+            and (self.due_from is not None or self.due_to is not None)
+            and statuses is not None
+            and statuses <= set(OPEN_STATUSES)
+        ):
+            start = 0 if self.due_from is None else bisect.bisect_left(deadlines, (self.due_from,))
+            stop = len(deadlines) if self.due_to is None else bisect.bisect_left(deadlines, (self.due_to + 1,))
+            best, self.plan = {task_id for _, task_id in deadlines[start:stop]}, "due_date"
+        for field in FILTER_FIELDS:
+            values = self.filters[field]
+            if values is None or field not in indexes:
+                continue
+            ids = set().union(*(indexes[field].get(value, ()) for value in values))
+            if best is None or len(ids) < len(best):
+                best, self.plan = ids, field
+        return best
+
+    def run(
+        self,
+        task_map: dict[int, Task],
+        indexes: dict[str, dict[str, set[int]]],
+        deadlines: list[tuple[int, int]] | None = None,
+    ) -> list[Task]:
+        """Выполнение запроса по задачам в памяти
+
+        Args:
+            task_map (dict[int, Task]): Задачи по айди
+            indexes (dict[str, dict[str, set[int]]]): Индексы TaskManager
+            deadlines (list[tuple[int, int]] | None): Индекс дедлайнов TaskManager
+
+        Returns:
+            list[Task]: Подходящие задачи
+        """
+        ids = self.choose_index(indexes, deadlines)
+        if ids is None:
+            self.plan = "scan"
+            return self.apply(task_map.values())
+        return self.apply(task_map[task_id] for task_id in sorted(ids))
+
+    def apply(self, tasks: Iterable[Task]) -> list[Task]:
+        """Фильтрация, сортировка и срез последовательности задач.
+
+        Без сортировки чтение останавливается, как только набрано limit задач.
+
+        Args:
+            tasks (Iterable[Task]): Задачи в порядке айди
+
+        Returns:
+            list[Task]: Подходящие задачи
+        """
+        tasks = (task for task in tasks if self.matches(task))
+        stop = None if self.limit is None else self.offset + self.limit
+        if not self.sort:
+            return list(islice(tasks, self.offset, stop))
+        if stop is not None and len(self.sort) == 1:
+            key = SORT_KEYS[self.sort[0].lstrip("-")]
+            select = heapq.nlargest if self.sort[0].startswith("-") else heapq.nsmallest
+            return select(stop, tasks, key=key)[self.offset:]
+        tasks = list(tasks)
+        for key in reversed(self.sort):
+            tasks.sort(key=SORT_KEYS[key.lstrip("-")], reverse=key.startswith("-"))
+        return tasks[self.offset:stop]
+
+
+def parse_where(expression: str, today: date | None = None) -> Query:
+    """Разбор выражения фильтра для пакетных команд.
+
+    Условия перечисляются через запятую:
+    category=работа, status=не выполнено|в процессе, priority=высокий,
+    due>=2024-11-01, due<=2024-11-30, overdue, due-within=7.
+
+    Args:
+        expression (str): Выражение фильтра
+        today (date | None): Текущая дата для overdue и due-within. По умолчанию - сегодня
+
+    Returns:
+        Query: Запрос
+
+    Raises:
+        ValueError: Если условие не распознано
+    """
+    today = today or date.today()
+    params = {}
+    for condition in filter(None, (part.strip() for part in expression.split(","))):
+        if condition == "overdue":
+            params["due_to"] = today - timedelta(days=1)
+            params.setdefault("status", OPEN_STATUSES)
+        elif condition.startswith("due-within="):
+            days = int(condition.split("=", 1)[1])
+            params["due_from"], params["due_to"] = today, today + timedelta(days=days)
+            params.setdefault("status", OPEN_STATUSES)
+        elif condition.startswith("due>="):
+            params["due_from"] = condition[5:].strip()
+        elif condition.startswith("due<="):
+            params["due_to"] = condition[5:].strip()
+        elif "=" in condition:
+            field, values = (part.strip() for part in condition.split("=", 1))
+            if field not in FILTER_FIELDS:
+                raise ValueError(f"Неизвестное поле фильтра: {field}")
+            params[field] = [value.strip() for value in values.split("|")]
+        else:
+            raise ValueError(f"Неизвестное условие фильтра: {condition}")
+    if not params:
+        raise ValueError("Пустой фильтр")
+    return Query(**params)
@@ -0,0 +1,131 @@
+import sys
+import csv
+import json
+from itertools import chain, islice
+from typing import Iterable, TextIO
+from task import Task
+
+
+FORMATS = ["table", "plain", "csv", "jsonl"]
+HEADER = ("ID", "Задача", "Описание", "Категория", "Срок выполнения", "Приоритет", "Статус")
+FIELDS = ["task_id", "title", "description", "category", "due_date", "priority", "status"]
+SAMPLE_SIZE = 1000  # Сколько первых задач просматривается для ширины колонок таблицы
+
+
+def task_cells(task: Task) -> tuple:
+    """Значения колонок таблицы для задачи
+
+    Args:
+        task (Task): Задача
+
+    Returns:
+        tuple: Значения в порядке HEADER
+    """
+    return (
+        task.task_id,
+        task.title,
+        task.description,
+        task.category,
+        task.due_date,
+        task.priority,
+        task.status,
+    )
+
+
+def column_widths(rows: Iterable[tuple]) -> list[int]:
+    """Ширина колонок по заголовку и строкам, как в utils.pretty_print
+
+    Args:
+        rows (Iterable[tuple]): Строки таблицы
+
+    Returns:
+        list[int]: Ширина каждой колонки с отступом
+    """
+    widths = [len(title) for title in HEADER]
+    for row in rows:
+        for i, value in enumerate(row):
+            widths[i] = max(widths[i], len(str(value)))
+    return [width + 3 for width in widths]
+
+
+def render_table(
+    tasks: Iterable[Task],
+    out: TextIO,
+    sample_size: int = SAMPLE_SIZE,
+    widths: list[int] | None = None,
+) -> int:
+    """Потоковый вывод задач таблицей.
+
+    Ширина колонок считается по первым sample_size задачам, после чего
+    строки выводятся по мере чтения. Если в списке не больше sample_size
+    задач, результат совпадает с utils.pretty_print. Более длинные значения
+    из остальной части списка просто сдвигают свою строку.
+
+    Args:
+        tasks (Iterable[Task]): Задачи
+        out (TextIO): Куда выводить
+        sample_size (int): Размер выборки для ширины колонок
+        widths (list[int] | None): Заранее известная ширина колонок, без выборки
+
+    Returns:
+        int: Количество выведенных задач
+    """
+    tasks = iter(tasks)
+    sample = [] if widths else [task_cells(task) for task in islice(tasks, sample_size)]
+    rows = chain(sample, map(task_cells, tasks))
+    first = next(rows, None)
+    if first is None:
+        return 0
+    widths = widths or column_widths(sample)
+    row_format = "".join("{:>" + str(width) + "}" for width in widths) + "\n"
+    out.write(row_format.format(*HEADER))
+    out.write(row_format.format(*first))
+    count = 1
+    for row in rows:
+        out.write(row_format.format(*row))
+        count += 1
+    return count
+
+
+def render_tasks(
+    tasks: Iterable[Task],
+    output_format: str = "table",
+    out: TextIO | None = None,
+    sample_size: int = SAMPLE_SIZE,
+) -> int:
+    """Потоковый вывод задач в одном из форматов FORMATS.
+
+    Задачи читаются из итератора по одной, поэтому память не зависит от
+    длины списка, а первые строки появляются сразу.
+
+    Args:
+        tasks (Iterable[Task]): Задачи
+        output_format (str): table - таблица, plain - значения через табуляцию,
+            csv - CSV с заголовком, jsonl - по объекту Json на строку
+        out (TextIO | None): Куда выводить. По умолчанию - stdout
+        sample_size (int): Размер выборки для ширины колонок таблицы
+
+    Returns:
+        int: Количество выведенных задач
+    """
+    out = out or sys.stdout
+    if output_format == "table":
+        return render_table(tasks, out, sample_size)
+    count = 0
+    if output_format == "csv":
+        writer = csv.writer(out)
+        writer.writerow(FIELDS)
+        for task in tasks:
+            writer.writerow(task_cells(task))
+            count += 1
+    elif output_format == "jsonl":
+        for task in tasks:
+            out.write(json.dumps(task.to_dict(), ensure_ascii=False) + "\n")
+            count += 1
+    elif output_format == "plain":
+        for task in tasks:
+            out.write("\t".join("" if value is None else str(value) for value in task_cells(task)) + "\n")
+            count += 1
+    else:
+        raise ValueError(f"Неизвестный формат вывода: {output_format}")
+    return count
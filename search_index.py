@@ -0,0 +1,260 @@
+import os
+import re
+import bisect
+import marshal
+from collections import Counter
+from typing import Iterable
+from task import Task
+from locking import atomic_open
+
+
+SEARCH_VERSION = 1
+COMPACT_RATIO = 4  # Журнал сворачивается в индекс, когда он больше 1/COMPACT_RATIO размера индекса
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Разбиение текста на слова в нижнем регистре
+
+    Args:
+        text (str): Текст
+
+    Returns:
+        list[str]: Слова
+    """
+    return TOKEN_RE.findall(text.lower())
+
+
+class SearchIndex:
+    """Обратный индекс слов из названия и описания задач.
+
+    Для каждого слова хранится айди задач и сколько раз слово в них встречается.
+    Отсортированный список слов нужен для поиска по префиксу.
+
+    Изменения задач не переписывают индекс на диске, а дописываются в журнал
+    рядом с ним (.log) вместе с отметками хранилища до и после записи.
+    При загрузке журнал применяется к индексу, если цепочка отметок доходит
+    от отметки индекса до текущей отметки хранилища.
+    """
+
+    def __init__(self, filename: str):
+        """
+        Args:
+            filename (str): Файл, в котором хранится индекс
+        """
+        self.filename = filename
+        self.log_filename = filename + ".log"
+        self.postings: dict[str, dict[int, int]] = {}
+        self.tokens: list[str] | None = None
+        # Размер журнала, примененного при загрузке
+        self.log_size = 0
+
+    @staticmethod
+    def document(task: Task) -> Counter:
+        return Counter(tokenize(task.title) + tokenize(task.description))
+
+    @classmethod
+    def documents(cls, changes: Iterable[tuple[str, Task]]) -> list[tuple[str, int, dict | None]]:
+        """Слова измененных задач для журнала и apply
+
+        Args:
+            changes (Iterable[tuple[str, Task]]): Изменения - тип (add, update или delete) и задача
+
+        Returns:
+            list[tuple[str, int, dict | None]]: Тип, айди и слова задачи. У удаленной задачи - None
+        """
+        return [
+            (op, task.task_id, None if op == "delete" else dict(cls.document(task)))
+            for op, task in changes
+        ]
+
+    def apply(self, documents: Iterable[tuple[str, int, dict | None]]) -> None:
+        """Применение изменений из documents: старые слова задач убираются, новые добавляются
+
+        Args:
+            documents (Iterable[tuple[str, int, dict | None]]): Результат documents
+        """
+        final, removed = {}, set()
+        for op, task_id, words in documents:
+            final[task_id] = words
+            if op != "add":
+                removed.add(task_id)
+        if removed:
+            # Старые слова задачи неизвестны, поэтому айди убираются проходом по всем словам
+            for token in list(self.postings):
+                ids = self.postings[token]
+                for task_id in ids.keys() & removed:
+                    del ids[task_id]
+                if not ids:
+                    del self.postings[token]
+                    self.tokens = None
+        for task_id, words in final.items():
+            for token, count in (words or {}).items():
+                if token not in self.postings:
+                    self.postings[token] = {}
+                    self.tokens = None
+                self.postings[token][task_id] = count
+
+    def add(self, task: Task) -> None:
+        """Добавление задачи в индекс
+
+        Args:
+            task (Task): Задача
+        """
+        for token, count in self.document(task).items():
+            if token not in self.postings:
+                self.postings[token] = {}
+                self.tokens = None
+            self.postings[token][task.task_id] = count
+
+    def remove(self, task: Task) -> None:
+        """Удаление задачи из индекса. Слова берутся из текущих полей задачи
+
+        Args:
+            task (Task): Задача
+        """
+        for token in self.document(task):
+            ids = self.postings.get(token)
+            if ids is None:
+                continue
+            ids.pop(task.task_id, None)
+            if not ids:
+                del self.postings[token]
+                self.tokens = None
+
+    def build(self, tasks: Iterable[Task]) -> None:
+        """Построение индекса с нуля
+
+        Args:
+            tasks (Iterable[Task]): Все задачи
+        """
+        self.postings = {}
+        self.tokens = None
+        for task in tasks:
+            self.add(task)
+
+    def matching_tokens(self, prefix: str) -> list[str]:
+        """Слова индекса, начинающиеся с prefix
+
+        Args:
+            prefix (str): Начало слова
+
+        Returns:
+            list[str]: Подходящие слова
+        """
+        if self.tokens is None:
+            self.tokens = sorted(self.postings)
+        start = bisect.bisect_left(self.tokens, prefix)
+        stop = bisect.bisect_left(self.tokens, prefix + "\U0010ffff")
+        return self.tokens[start:stop]
+
+    def search(self, text: str, prefix: bool = True) -> list[tuple[int, int]]:
+        """Поиск задач, содержащих все слова запроса
+
+        Args:
+            text (str): Запрос
+            prefix (bool): Считать слова запроса началом слов в задаче
+
+        Returns:
+            list[tuple[int, int]]: Айди задач и их вес по частоте слов, от большего к меньшему
+        """
+        scores = None
+        for term in set(tokenize(text)):
+            tokens = self.matching_tokens(term) if prefix else [term]
+            term_scores = Counter()
+            for token in tokens:
+                term_scores.update(self.postings.get(token, {}))
+            if scores is None:
+                scores = dict(term_scores)
+            else:
+                scores = {
+                    task_id: score + term_scores[task_id]
+                    for task_id, score in scores.items()
+                    if task_id in term_scores
+                }
+        if not scores:
+            return []
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+    def load(self, stamp) -> bool:
+        """Загрузка индекса с диска и применение журнала изменений
+
+        Args:
+            stamp: Отметка хранилища, для которой нужен индекс
+
+        Returns:
+            bool: True, если индекс загружен и соответствует отметке
+        """
+        if stamp is None:
+            return False
+        try:
+            with open(self.filename, "rb") as file:
+                version, current, postings = marshal.loads(file.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return False
+        if version != SEARCH_VERSION:
+            return False
+        documents = []
+        try:
+            with open(self.log_filename, "rb") as file:
+                while current != stamp:
+                    try:
+                        before, after, changes = marshal.load(file)
+                    except (EOFError, ValueError, TypeError):
+                        # Конец журнала или недописанная запись
+                        break
+                    if before == current:
+                        documents.extend(changes)
+                        current = after
+                self.log_size = file.tell()
+        except OSError:
+            pass
+        if current != stamp:
+            return False
+        self.postings = postings
+        self.tokens = None
+        self.apply(documents)
+        return True
+
+    def needs_compaction(self) -> bool:
+        """Журнал стал заметной частью индекса и его стоит свернуть вызовом save"""
+        try:
+            return self.log_size * COMPACT_RATIO > os.path.getsize(self.filename)
+        except OSError:
+            return False
+
+    def log(self, before, after, changes: list[tuple[str, Task]]) -> None:
+        """Дописывание изменений в журнал индекса на диске. Вызывается под блокировкой хранилища.
+
+        Если индекса на диске нет, писать нечего: он будет построен при поиске.
+        Журнал, который перерос сам индекс (поиска давно не было), удаляется
+        вместе с индексом - перестроить его дешевле, чем применять журнал.
+
+        Args:
+            before: Отметка хранилища до записи
+            after: Отметка хранилища после записи
+            changes (list[tuple[str, Task]]): Сохраненные изменения
+        """
+        if before is None or after is None or not os.path.exists(self.filename):
+            return
+        with open(self.log_filename, "ab") as file:
+            file.write(marshal.dumps((before, after, self.documents(changes))))
+            size = file.tell()
+        if size > os.path.getsize(self.filename):
+            os.remove(self.filename)
+            os.remove(self.log_filename)
+
+    def save(self, stamp) -> None:
+        """Сохранение индекса на диск вместе с отметкой хранилища
+
+        Args:
+            stamp: Отметка хранилища, которому соответствует индекс
+        """
+        if stamp is None:
+            return
+        with atomic_open(self.filename, "wb") as file:
+            marshal.dump((SEARCH_VERSION, stamp, self.postings), file)
+        # Все изменения из журнала уже в индексе
+        if os.path.exists(self.log_filename):
+            os.remove(self.log_filename)
+        self.log_size = 0
@@ -0,0 +1,138 @@
+import io
+import os
+import json
+import asyncio
+import traceback
+from contextlib import redirect_stdout
+from typing import Callable
+import client
+from client import SOCKET_PATH
+
+
+GROUP_COMMIT_WINDOW = 0.005  # Сколько секунд копить изменения от разных клиентов перед записью
+
+
+class GroupCommit:
+    """Групповая запись изменений.
+
+    Клиенты, изменившие задачи в пределах одного окна, ждут общую запись
+    в хранилище и получают ответ только после нее. Так несколько изменений
+    сохраняются одной перезаписью файла или одним fsync журнала.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[], None],
+        has_pending: Callable[[], bool],
+        window: float = GROUP_COMMIT_WINDOW,
+    ):
+        """
+        Args:
+            flush (Callable[[], None]): Сохраняет накопленные изменения
+            has_pending (Callable[[], bool]): Есть ли несохраненные изменения
+            window (float): Окно накопления изменений в секундах
+        """
+        self.flush = flush
+        self.has_pending = has_pending
+        self.window = window
+        self.waiters: list[asyncio.Future] = []
+
+    async def wait(self) -> None:
+        """Ожидание записи изменений, сделанных текущей командой"""
+        if not self.has_pending():
+            return
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self.waiters.append(waiter)
+        if len(self.waiters) == 1:
+            loop.call_later(self.window, self.run)
+        await waiter
+
+    def run(self) -> None:
+        waiters, self.waiters = self.waiters, []
+        try:
+            self.flush()
+        except Exception as error:
+            for waiter in waiters:
+                waiter.set_exception(error)
+            return
+        for waiter in waiters:
+            waiter.set_result(None)
+
+
+async def handle_client(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    handler: Callable[[list[str]], bool],
+    group_commit: GroupCommit | None = None,
+) -> None:
+    """Выполнение одной команды, пришедшей от клиента
+
+    Args:
+        reader (asyncio.StreamReader): Поток запроса
+        writer (asyncio.StreamWriter): Поток ответа
+        handler (Callable[[list[str]], bool]): Выполняет команду и возвращает
+            False, если команду нужно выполнить на стороне клиента
+        group_commit (GroupCommit | None): Групповая запись изменений
+    """
+    request = json.loads(await reader.readline())
+    output = io.StringIO()
+    with redirect_stdout(output):
+        try:
+            handled = handler(request["argv"])
+        except (Exception, SystemExit):
+            traceback.print_exc(file=output)
+            handled = True
+    if group_commit is not None:
+        try:
+            await group_commit.wait()
+        except Exception as error:
+            output.write(f"Ошибка сохранения: {error}\n")
+    response = {"handled": handled, "output": output.getvalue()}
+    writer.write((json.dumps(response, ensure_ascii=False) + "\n").encode("utf-8"))
+    await writer.drain()
+    writer.close()
+    await writer.wait_closed()
+
+
+async def run_server(
+    handler: Callable[[list[str]], bool],
+    path: str,
+    group_commit: GroupCommit | None = None,
+) -> None:
+    if os.path.exists(path):
+        os.remove(path)
+    unix_server = await asyncio.start_unix_server(
+        lambda reader, writer: handle_client(reader, writer, handler, group_commit),
+        path=path,
+    )
+    async with unix_server:
+        await unix_server.serve_forever()
+
+
+def serve(
+    handler: Callable[[list[str]], bool],
+    path: str = SOCKET_PATH,
+    group_commit: GroupCommit | None = None,
+) -> None:
+    """Запуск сервера на Unix сокете. Команды выполняются по очереди в одном процессе
+
+    Args:
+        handler (Callable[[list[str]], bool]): Выполняет команду по списку аргументов
+        path (str): Путь до Unix сокета
+        group_commit (GroupCommit | None): Групповая запись изменений
+    """
+    if not hasattr(asyncio, "start_unix_server"):
+        print("Сервер не поддерживается на этой платформе.")
+        return
+    if client.is_running(path):
+        print(f"Сервер уже запущен: {path}")
+        return
+    print(f"Сервер запущен: {path}")
+    try:
+        asyncio.run(run_server(handler, path, group_commit))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,1083 @@
+import os
+import gzip
+import json
+import struct
+import marshal
+import sqlite3
+import heapq
+import hashlib
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from typing import Callable, Iterable, Iterator, TextIO
+from datetime import date
+from task import Task, CATEGORY_CODES, PRIORITY_CODES, STATUS_CODES
+from query import Query
+from cache import SnapshotCache
+from locking import FileLock, atomic_open
+
+
+JOURNAL_LIMIT = 1024 * 1024  # Размер журнала в байтах, после которого он сворачивается в снапшот
+CHUNK_SIZE = 64 * 1024  # Размер блока при потоковом чтении Json файла
+FORMAT_VERSION = 2
+FORMAT_COLUMNS = [
+    "task_id",
+    "title",
+    "description",
+    "category",
+    "due_ordinal",
+    "priority",
+    "status",
+    "completed_ordinal",
+]
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def open_text(filename: str) -> TextIO:
+    """Открытие Json файла на чтение. Сжатый gzip файл распознается по первым байтам
+
+    Args:
+        filename (str): Путь до файла
+
+    Returns:
+        TextIO: Открытый файл
+    """
+    with open(filename, "rb") as file:
+        compressed = file.read(2) == GZIP_MAGIC
+    if compressed:
+        return gzip.open(filename, "rt", encoding="utf-8")
+    return open(filename, "r", encoding="utf-8")
+
+
+def dump_tasks(tasks: Iterable[Task]) -> str:
+    """Текст Json файла задач в текущем формате.
+
+    Первый элемент массива - заголовок с версией формата, названиями колонок
+    и словарями категорий, приоритетов и статусов. Остальные элементы -
+    задачи строками Task.to_codes, по одной на строку файла. Повторяющиеся
+    строки хранятся один раз в словарях, кириллица не экранируется.
+
+    Args:
+        tasks (Iterable[Task]): Задачи
+
+    Returns:
+        str: Содержимое файла
+    """
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    rows = [encode(task.to_codes()) for task in tasks]
+    header = {
+        "format": FORMAT_VERSION,
+        "columns": FORMAT_COLUMNS,
+        "dictionaries": {
+            "category": CATEGORY_CODES.values,
+            "priority": PRIORITY_CODES.values,
+            "status": STATUS_CODES.values,
+        },
+    }
+    return "[\n" + ",\n".join([encode(header)] + rows) + "\n]\n"
+
+
+def is_header(item) -> bool:
+    return isinstance(item, dict) and "format" in item
+
+
+def row_decoder(header: dict) -> Callable[[list], Task]:
+    """Функция для чтения задач по заголовку файла
+
+    Args:
+        header (dict): Первый элемент массива
+
+    Returns:
+        Callable[[list], Task]: Перевод строки файла в задачу
+
+    Raises:
+        ValueError: Если файл записан более новой версией формата
+    """
+    if header["format"] > FORMAT_VERSION:
+        raise ValueError(f"Неизвестная версия формата файла задач: {header['format']}")
+    dictionaries = header["dictionaries"]
+    maps = (
+        [CATEGORY_CODES.code(value) for value in dictionaries["category"]],
+        [PRIORITY_CODES.code(value) for value in dictionaries["priority"]],
+        [STATUS_CODES.code(value) for value in dictionaries["status"]],
+    )
+    return lambda row: Task.from_codes(row, *maps)
+
+
+def parse_tasks(items: list) -> tuple[list[Task], bool]:
+    """Разбор массива из Json файла любой версии формата
+
+    Args:
+        items (list): Разобранный Json массив
+
+    Returns:
+        tuple[list[Task], bool]: Задачи и признак старого формата (массив словарей)
+    """
+    if items and is_header(items[0]):
+        decode = row_decoder(items[0])
+        return [decode(row) for row in items[1:]], False
+    return [Task.from_dict(item) for item in items], bool(items)
+
+
+def iter_json_array(filename: str, chunk_size: int = CHUNK_SIZE) -> Iterator[dict]:
+    """Потоковое чтение Json массива по одному элементу.
+
+    Файл читается блоками, в памяти одновременно находится только текущий
+    блок и разбираемый элемент, а не весь файл и не все дерево словарей.
+
+    Args:
+        filename (str): Путь до Json файла с массивом объектов
+        chunk_size (int): Размер читаемого блока в символах
+
+    Yields:
+        dict: Очередной элемент массива
+    """
+    decoder = json.JSONDecoder()
+    with open_text(filename) as file:
+        buffer = file.read(chunk_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{filename} не содержит Json массив")
+        pos = 1
+        eof = False
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == "]":
+                return
+            try:
+                if pos >= len(buffer):
+                    raise json.JSONDecodeError("Конец блока", buffer, pos)
+                item, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = file.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            yield item
+
+
+class Storage:
+    """Базовый класс хранилища задач.
+
+    Хранилище отвечает только за чтение и запись задач, вся логика работы
+    со списком остается в TaskManager. Если lazy = True, TaskManager не держит
+    все задачи в памяти, а обращается к хранилищу точечными запросами.
+    """
+
+    lazy = False
+
+    def sidecar(self, suffix: str) -> str:
+        """Путь до служебного файла рядом с хранилищем: индекса поиска, архива, ленты изменений
+
+        Args:
+            suffix (str): Расширение служебного файла
+
+        Returns:
+            str: Путь до файла хранилища с добавленным suffix, например tasks.db.changes.
+                У разных хранилищ с одним именем служебные файлы не пересекаются
+        """
+        return self.filename + suffix
+
+    def phase(self, name: str):
+        """Замер фазы работы хранилища. TaskManager подменяет его своим, если есть подписчики
+
+        Args:
+            name (str): Название фазы
+
+        Returns:
+            Контекстный менеджер замера. По умолчанию - пустой
+        """
+        return nullcontext()
+
+    def load(self) -> list[Task]:
+        """Загрузка всех задач
+
+        Returns:
+            list[Task]: Список задач
+        """
+        raise NotImplementedError
+
+    def stamp(self):
+        """Отметка состояния хранилища. Если она изменилась - данные поменял другой процесс
+
+        Returns:
+            Любое сравнимое значение или None, если хранилище не отслеживает изменения
+        """
+        return None
+
+    def iter_tasks(self) -> Iterator[Task]:
+        """Последовательное чтение задач. По умолчанию - через полную загрузку
+
+        Yields:
+            Task: Очередная задача
+        """
+        yield from self.load()
+
+    def save(self, tasks: Iterable[Task]) -> None:
+        """Полная перезапись хранилища
+
+        Args:
+            tasks (Iterable[Task]): Список задач
+        """
+        raise NotImplementedError
+
+    def commit(self, tasks: Iterable[Task], changes: list[tuple[str, Task]]) -> None:
+        """Сохранение пачки изменений. По умолчанию - одна полная перезапись
+
+        Args:
+            tasks (Iterable[Task]): Текущий список задач
+            changes (list[tuple[str, Task]]): Изменения - тип (add, update
+                или delete) и измененная задача
+        """
+        self.save(tasks)
+
+    def lock(self):
+        """Межпроцессная блокировка на время чтения-изменения-записи
+
+        Returns:
+            Контекстный менеджер блокировки. По умолчанию - пустой
+        """
+        return nullcontext()
+
+    def get(self, task_id: int) -> Task | None:
+        """Поиск задачи по айди
+
+        Args:
+            task_id (int): Айди задачи
+
+        Returns:
+            Task | None: Задача или None, если не найдена
+        """
+        for task in self.iter_tasks():
+            if task.task_id == task_id:
+                return task
+        return None
+
+    def by_category(self, category: str) -> list[Task]:
+        """Поиск задач по категории
+
+        Args:
+            category (str): Категория
+
+        Returns:
+            list[Task]: Задачи из категории
+        """
+        return [task for task in self.iter_tasks() if task.category == category]
+
+    def query(self, query: Query) -> list[Task]:
+        """Выполнение запроса. По умолчанию - фильтрация при последовательном чтении
+
+        Args:
+            query (Query): Запрос
+
+        Returns:
+            list[Task]: Подходящие задачи
+        """
+        query.plan = "stream"
+        return query.apply(self.iter_tasks())
+
+    def next_id(self) -> int:
+        """Айди для новой задачи
+
+        Returns:
+            int: Свободный айди
+        """
+        return max((task.task_id for task in self.iter_tasks()), default=0) + 1
+
+
+class JsonStorage(Storage):
+    """Хранение задач в Json файле, опционально - с журналом изменений"""
+
+    def __init__(
+        self,
+        filename="tasks.json",
+        journal: bool = False,
+        journal_limit: int = JOURNAL_LIMIT,
+        cache: bool = True,
+        compress: bool = False,
+    ):
+        """
+        Args:
+            filename (str): Json файл с задачами
+            journal (bool): Сохранять изменения в журнал вместо полной перезаписи файла
+            journal_limit (int): Размер журнала, после которого он сворачивается в снапшот
+            cache (bool): Держать рядом бинарный кеш разобранного файла
+            compress (bool): Сжимать файл gzip при записи. Читаются оба варианта
+        """
+        self.filename = filename
+        self.compress = compress
+        self.journal = journal
+        self.journal_filename = os.path.splitext(filename)[0] + ".journal"
+        self.journal_limit = journal_limit
+        self.cache = SnapshotCache(filename) if cache else None
+        self.file_lock = FileLock(os.path.splitext(filename)[0] + ".lock")
+
+    def load(self) -> list[Task]:
+        """Сбор задач из Json файла (или его бинарного кеша) с последующим применением журнала изменений.
+
+        Файл старого формата (массив словарей) после чтения переписывается в текущем формате.
+        """
+        tasks = []
+        legacy = False
+        stamp = self.stamp()
+        if os.path.exists(self.filename):
+            tasks = None
+            if self.cache:
+                with self.phase("cache_load"):
+                    tasks = self.cache.load()
+                legacy = tasks is not None and self.is_legacy()
+            if tasks is None:
+                with self.phase("read"), open(self.filename, "rb") as file:
+                    # Отметка берется с того же открытого файла, который читается,
+                    # чтобы кеш не связал старые задачи с уже замененным файлом
+                    stat = os.fstat(file.fileno())
+                    raw = file.read()
+                with self.phase("parse"):
+                    data = json.loads(gzip.decompress(raw) if raw[:2] == GZIP_MAGIC else raw)
+                with self.phase("construct"):
+                    tasks, legacy = parse_tasks(data)
+                del data
+                if self.cache:
+                    with self.phase("cache_save"):
+                        self.cache.save(tasks, stat, hashlib.blake2b(raw).hexdigest())
+        else:
+            with self.lock():
+                if not os.path.exists(self.filename):
+                    with atomic_open(self.filename) as file:
+                        json.dump([], file)
+        if os.path.exists(self.journal_filename):
+            tasks = self.replay_journal(tasks)
+        if legacy:
+            with self.lock():
+                # Файл переписывается, только если его не изменили с момента чтения
+                if self.stamp() == stamp:
+                    self.save(tasks)
+        return tasks
+
+    def is_legacy(self) -> bool:
+        """Проверка по началу файла, что он записан в старом формате - массивом словарей
+
+        Returns:
+            bool: True для непустого файла старого формата
+        """
+        with open(self.filename, "rb") as file:
+            head = file.read(256)
+        if head[:2] == GZIP_MAGIC:
+            return False
+        head = head.decode("utf-8", errors="ignore").lstrip()[1:].lstrip()
+        return head.startswith("{") and not head.startswith('{"format"')
+
+    def stamp(self) -> tuple:
+        stamp = []
+        for filename in (self.filename, self.journal_filename):
+            try:
+                stat = os.stat(filename)
+                stamp.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def iter_tasks(self) -> Iterator[Task]:
+        """Потоковое чтение задач из Json файла без загрузки всего файла в память.
+
+        Журнал небольшой (ограничен journal_limit), поэтому он читается целиком
+        и его записи подменяют соответствующие задачи из снапшота на лету.
+        """
+        changes = self.read_journal() if os.path.exists(self.journal_filename) else {}
+        if os.path.exists(self.filename):
+            decode = Task.from_dict
+            for data in iter_json_array(self.filename):
+                if is_header(data):
+                    decode = row_decoder(data)
+                    continue
+                task_id = data["task_id"] if isinstance(data, dict) else data[0]
+                if task_id in changes:
+                    data = changes.pop(task_id)
+                    if data is None:
+                        continue
+                    yield Task.from_dict(data)
+                else:
+                    yield decode(data)
+        for data in changes.values():
+            if data is not None:
+                yield Task.from_dict(data)
+
+    def read_journal(self) -> dict[int, dict | None]:
+        """Чтение журнала в виде последнего состояния каждой измененной задачи
+
+        Returns:
+            dict[int, dict | None]: Айди задачи и ее словарь, None - задача удалена
+        """
+        changes = {}
+        with open(self.journal_filename, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Оборванная запись в конце журнала - процесс упал во время записи
+                    break
+                if record["op"] == "delete":
+                    changes[record["task_id"]] = None
+                else:
+                    changes[record["task"]["task_id"]] = record["task"]
+        return changes
+
+    def replay_journal(self, tasks: Iterable[Task]) -> list[Task]:
+        """Применение записей журнала поверх загруженного снапшота.
+
+        Записи применяются идемпотентно, поэтому повторное применение журнала
+        поверх уже свернутого снапшота не меняет результат.
+        """
+        tasks = {task.task_id: task for task in tasks}
+        for task_id, data in self.read_journal().items():
+            if data is None:
+                tasks.pop(task_id, None)
+            else:
+                tasks[task_id] = Task.from_dict(data)
+        return list(tasks.values())
+
+    def save(self, tasks: Iterable[Task]) -> None:
+        """Сохранение задач в Json файл. Журнал после этого уже не нужен и удаляется"""
+        tasks = list(tasks)
+        with self.phase("serialize"):
+            data = dump_tasks(tasks).encode("utf-8")
+            if self.compress:
+                data = gzip.compress(data, compresslevel=6, mtime=0)
+        with self.phase("write"), atomic_open(self.filename, "wb") as file:
+            file.write(data)
+        if self.cache:
+            with self.phase("cache_save"):
+                # Хеш считается по только что записанным байтам, а не повторным чтением файла
+                self.cache.save(tasks, os.stat(self.filename), hashlib.blake2b(data).hexdigest())
+        if os.path.exists(self.journal_filename):
+            os.remove(self.journal_filename)
+
+    def commit(self, tasks: Iterable[Task], changes: list[tuple[str, Task]]) -> None:
+        """Сохранение изменений: запись в журнал или полная перезапись файла.
+
+        Все изменения пачки дописываются в журнал одной записью с одним fsync.
+        """
+        if not self.journal:
+            self.save(tasks)
+            return
+        lines = []
+        for op, task in changes:
+            if op == "delete":
+                record = {"op": op, "task_id": task.task_id}
+            else:
+                record = {"op": op, "task": task.to_dict()}
+            lines.append(json.dumps(record, ensure_ascii=False) + "\n")
+        with open(self.journal_filename, "a", encoding="utf-8") as file:
+            file.write("".join(lines))
+            file.flush()
+            os.fsync(file.fileno())
+            size = file.tell()
+        if size >= self.journal_limit:
+            self.save(tasks)
+
+    def lock(self) -> FileLock:
+        return self.file_lock
+
+    def sidecar(self, suffix: str) -> str:
+        path = super().sidecar(suffix)
+        # Раньше служебные файлы назывались без расширения хранилища (tasks.archive.gz).
+        # Они созданы Json хранилищем по умолчанию и переходят к нему
+        legacy = os.path.splitext(self.filename)[0] + suffix
+        if legacy != path and not os.path.exists(path) and os.path.exists(legacy):
+            os.replace(legacy, path)
+        return path
+
+
+class SqliteStorage(Storage):
+    """Хранение задач в SQLite с индексами по основным полям"""
+
+    lazy = True
+    columns = (
+        "task_id",
+        "title",
+        "description",
+        "category",
+        "due_date",
+        "priority",
+        "status",
+        "completed_at",
+    )
+
+    def __init__(self, filename="tasks.db", source: str | None = None):
+        """
+        Args:
+            filename (str): Файл базы данных
+            source (str | None): Json файл, из которого переносятся задачи при создании базы
+        """
+        self.filename = filename
+        self.file_lock = FileLock(os.path.splitext(filename)[0] + ".lock")
+        is_new = not os.path.exists(filename)
+        # Соединение может использоваться не из создавшего его потока (AsyncTaskManager
+        # вызывает менеджер в своем потоке). Вызовы при этом идут по одному
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id INTEGER PRIMARY KEY,
+                title TEXT NOT NULL,
+                description TEXT NOT NULL DEFAULT '',
+                category TEXT,
+                due_date TEXT,
+                priority TEXT,
+                status TEXT,
+                completed_at TEXT
+            );
+            CREATE INDEX IF NOT EXISTS tasks_category ON tasks (category);
+            CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status);
+            CREATE INDEX IF NOT EXISTS tasks_priority ON tasks (priority);
+            CREATE INDEX IF NOT EXISTS tasks_due_date ON tasks (due_date);
+            """
+        )
+        self.add_missing_columns()
+        if is_new and source and os.path.exists(source):
+            with self.lock():
+                if not self.connection.execute("SELECT 1 FROM tasks LIMIT 1").fetchone():
+                    self.migrate_from_json(source)
+
+    def add_missing_columns(self) -> None:
+        """Добавление колонок, которых нет в базе, созданной более старой версией.
+        Дата выполнения у уже сохраненных задач остается неизвестной"""
+        existing = {row[1] for row in self.connection.execute("PRAGMA table_info(tasks)")}
+        with self.connection:
+            for column in self.columns:
+                if column not in existing:
+                    self.connection.execute(f"ALTER TABLE tasks ADD COLUMN {column} TEXT")
+
+    @property
+    def placeholders(self) -> str:
+        return ", ".join("?" * len(self.columns))
+
+    def migrate_from_json(self, source: str) -> int:
+        """Одноразовый перенос задач из Json файла в базу
+
+        Args:
+            source (str): Путь до Json файла
+
+        Returns:
+            int: Количество перенесенных задач
+        """
+        tasks = JsonStorage(source).load()
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO tasks ({', '.join(self.columns)}) VALUES ({self.placeholders})",
+                [self._to_row(task) for task in tasks],
+            )
+        return len(tasks)
+
+    def stamp(self) -> tuple | None:
+        try:
+            stat = os.stat(self.filename)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def lock(self) -> FileLock:
+        # Айди из next_id выдается и задача вставляется под одной блокировкой,
+        # иначе параллельные процессы получат одинаковый айди и INSERT OR REPLACE затрет задачу
+        return self.file_lock
+
+    def _to_row(self, task: Task) -> tuple:
+        data = task.to_dict()
+        return tuple(data.get(column) for column in self.columns)
+
+    def _to_task(self, row: tuple) -> Task:
+        return Task.from_dict(dict(zip(self.columns, row)))
+
+    def _select(self, where: str = "", params: tuple = ()) -> list[Task]:
+        query = f"SELECT {', '.join(self.columns)} FROM tasks {where} ORDER BY task_id"
+        return [self._to_task(row) for row in self.connection.execute(query, params)]
+
+    def load(self) -> list[Task]:
+        return self._select()
+
+    def iter_tasks(self) -> Iterator[Task]:
+        query = f"SELECT {', '.join(self.columns)} FROM tasks ORDER BY task_id"
+        for row in self.connection.execute(query):
+            yield self._to_task(row)
+
+    def save(self, tasks: Iterable[Task]) -> None:
+        with self.connection:
+            self.connection.execute("DELETE FROM tasks")
+            self.connection.executemany(
+                f"INSERT INTO tasks ({', '.join(self.columns)}) VALUES ({self.placeholders})",
+                [self._to_row(task) for task in tasks],
+            )
+
+    def commit(self, tasks: Iterable[Task], changes: list[tuple[str, Task]]) -> None:
+        with self.connection:
+            for op, task in changes:
+                if op == "delete":
+                    self.connection.execute(
+                        "DELETE FROM tasks WHERE task_id = ?", (task.task_id,)
+                    )
+                else:
+                    self.connection.execute(
+                        f"INSERT OR REPLACE INTO tasks ({', '.join(self.columns)}) VALUES ({self.placeholders})",
+                        self._to_row(task),
+                    )
+
+    def get(self, task_id: int) -> Task | None:
+        tasks = self._select("WHERE task_id = ?", (task_id,))
+        return tasks[0] if tasks else None
+
+    def by_category(self, category: str) -> list[Task]:
+        return self._select("WHERE category = ?", (category,))
+
+    def query(self, query: Query) -> list[Task]:
+        """Фильтры запроса выполняются в SQLite по индексам, сортировка и срез - в Python"""
+        conditions, params = [], []
+        for field, values in query.filters.items():
+            if values is not None:
+                conditions.append(f"{field} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+        if query.due_from is not None:
+            conditions.append("due_date >= ?")
+            params.append(date.fromordinal(query.due_from).isoformat())
+        if query.due_to is not None:
+            conditions.append("due_date <= ?")
+            params.append(date.fromordinal(query.due_to).isoformat())
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query.plan = "sqlite"
+        return query.apply(self._select(where, tuple(params)))
+
+    def next_id(self) -> int:
+        (max_id,) = self.connection.execute("SELECT MAX(task_id) FROM tasks").fetchone()
+        return (max_id or 0) + 1
+
+
+class RecordStorage(Storage):
+    """Хранение задач записями в бинарном файле с индексом айди - смещение записи.
+
+    Файл задач - последовательность записей: заголовок (размер места под
+    запись, длина данных, айди) и кортеж Task.to_row в marshal. Индекс -
+    массив смещений фиксированной ширины, смещение задачи с айди N лежит в
+    ячейке N, 0 - задачи нет. Поэтому чтение и изменение одной задачи
+    затрагивает только ее ячейку индекса и ее запись, сколько бы задач ни было.
+
+    Индекс считается источником правды: запись, на которую не указывает
+    индекс (старая версия или удаленная задача), пропускается и исчезает
+    при следующей полной перезаписи через save.
+    """
+
+    lazy = True
+    DATA_MAGIC = b"TASKREC1"
+    INDEX_HEADER = struct.Struct("<8sq")  # Метка формата и следующий айди
+    RECORD_HEADER = struct.Struct("<III")  # Место под данные, длина данных, айди
+    SLOT = struct.Struct("<q")
+    SLACK = 16  # Запас места в записи, чтобы смена статуса не переносила запись в конец файла
+
+    def __init__(self, filename="tasks.records", source: str | None = None):
+        """
+        Args:
+            filename (str): Файл записей. Индекс лежит рядом с расширением .idx
+            source (str | None): Json файл, из которого переносятся задачи при создании хранилища
+        """
+        self.filename = filename
+        self.index_filename = os.path.splitext(filename)[0] + ".idx"
+        self.file_lock = FileLock(os.path.splitext(filename)[0] + ".lock")
+        if not os.path.exists(self.index_filename):
+            with self.lock():
+                if not os.path.exists(self.index_filename):
+                    tasks = JsonStorage(source).load() if source and os.path.exists(source) else []
+                    self.save(tasks)
+
+    def _slot(self, task_id: int) -> int:
+        return self.INDEX_HEADER.size + (task_id - 1) * self.SLOT.size
+
+    def _read_offset(self, index_file, task_id: int) -> int:
+        if task_id < 1:
+            return 0
+        index_file.seek(self._slot(task_id))
+        data = index_file.read(self.SLOT.size)
+        return self.SLOT.unpack(data)[0] if len(data) == self.SLOT.size else 0
+
+    def _read_record(self, data_file, offset: int) -> tuple[int, int, Task]:
+        data_file.seek(offset)
+        capacity, length, task_id = self.RECORD_HEADER.unpack(data_file.read(self.RECORD_HEADER.size))
+        return capacity, task_id, Task.from_row(marshal.loads(data_file.read(length)))
+
+    def _pack(self, payload: bytes, task_id: int, capacity: int | None = None) -> bytes:
+        if capacity is None:
+            capacity = len(payload) + self.SLACK
+        header = self.RECORD_HEADER.pack(capacity, len(payload), task_id)
+        return header + payload + b"\0" * (capacity - len(payload))
+
+    def stamp(self) -> tuple:
+        stamp = []
+        for filename in (self.filename, self.index_filename):
+            try:
+                stat = os.stat(filename)
+                stamp.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def lock(self) -> FileLock:
+        return self.file_lock
+
+    def load(self) -> list[Task]:
+        return list(self.iter_tasks())
+
+    def iter_tasks(self) -> Iterator[Task]:
+        """Последовательное чтение живых записей в порядке айди"""
+        offsets = array("q")
+        with open(self.index_filename, "rb") as index_file:
+            index_file.seek(self.INDEX_HEADER.size)
+            offsets.frombytes(index_file.read())
+        with open(self.filename, "rb") as data_file:
+            for offset in offsets:
+                if offset:
+                    yield self._read_record(data_file, offset)[2]
+
+    def get(self, task_id: int) -> Task | None:
+        """Чтение одной задачи по смещению из индекса, без чтения остальных записей"""
+        with open(self.index_filename, "rb") as index_file:
+            offset = self._read_offset(index_file, task_id)
+        if not offset:
+            return None
+        with open(self.filename, "rb") as data_file:
+            _, record_id, task = self._read_record(data_file, offset)
+        if record_id != task_id:
+            # Файлы заменили между чтением индекса и записи - читаем заново целиком
+            return super().get(task_id)
+        return task
+
+    def next_id(self) -> int:
+        """Следующий айди из сохраненной последовательности. Айди удаленных задач не выдаются повторно"""
+        with open(self.index_filename, "rb") as index_file:
+            _, sequence = self.INDEX_HEADER.unpack(index_file.read(self.INDEX_HEADER.size))
+        return sequence
+
+    def save(self, tasks: Iterable[Task]) -> None:
+        """Полная перезапись с уплотнением: старые версии записей не переносятся"""
+        sequence = self.next_id() if os.path.exists(self.index_filename) else 1
+        offsets = {}
+        with atomic_open(self.filename, "wb") as data_file:
+            data_file.write(self.DATA_MAGIC)
+            for task in tasks:
+                offsets[task.task_id] = data_file.tell()
+                data_file.write(self._pack(marshal.dumps(task.to_row()), task.task_id))
+        sequence = max(sequence, max(offsets, default=0) + 1)
+        offsets_array = array("q", bytes(8 * (sequence - 1)))
+        for task_id, offset in offsets.items():
+            offsets_array[task_id - 1] = offset
+        with atomic_open(self.index_filename, "wb") as index_file:
+            index_file.write(self.INDEX_HEADER.pack(self.DATA_MAGIC, sequence))
+            index_file.write(offsets_array.tobytes())
+
+    def commit(self, tasks: Iterable[Task], changes: list[tuple[str, Task]]) -> None:
+        """Точечное сохранение изменений.
+
+        Измененная запись перезаписывается на месте, если помещается в свое
+        место, иначе дописывается в конец файла. Индекс обновляется после
+        того, как записи сброшены на диск.
+        """
+        slots = {}
+        with open(self.index_filename, "r+b") as index_file:
+            _, sequence = self.INDEX_HEADER.unpack(index_file.read(self.INDEX_HEADER.size))
+            with open(self.filename, "r+b") as data_file:
+                for op, task in changes:
+                    offset = slots.get(task.task_id)
+                    if offset is None:
+                        offset = self._read_offset(index_file, task.task_id)
+                    if op == "delete":
+                        slots[task.task_id] = 0
+                        continue
+                    payload = marshal.dumps(task.to_row())
+                    if offset:
+                        data_file.seek(offset)
+                        capacity = self.RECORD_HEADER.unpack(data_file.read(self.RECORD_HEADER.size))[0]
+                        if len(payload) <= capacity:
+                            data_file.seek(offset)
+                            data_file.write(self._pack(payload, task.task_id, capacity))
+                            continue
+                    data_file.seek(0, os.SEEK_END)
+                    slots[task.task_id] = data_file.tell()
+                    data_file.write(self._pack(payload, task.task_id))
+                    sequence = max(sequence, task.task_id + 1)
+                data_file.flush()
+                os.fsync(data_file.fileno())
+            for task_id, offset in slots.items():
+                index_file.seek(self._slot(task_id))
+                index_file.write(self.SLOT.pack(offset))
+            index_file.seek(0)
+            index_file.write(self.INDEX_HEADER.pack(self.DATA_MAGIC, sequence))
+            index_file.flush()
+            os.fsync(index_file.fileno())
+
+
+def load_shard_rows(filename: str) -> bytes:
+    """Чтение одного шарда в процессе-воркере.
+
+    Задачи передаются обратно кортежами to_row в marshal - это заметно
+    быстрее, чем pickle списка объектов.
+
+    Args:
+        filename (str): Json файл шарда
+
+    Returns:
+        bytes: Задачи шарда в marshal
+    """
+    return marshal.dumps([task.to_row() for task in JsonStorage(filename).load()])
+
+
+class ShardedStorage(Storage):
+    """Хранение задач в нескольких Json файлах (шардах) по категории и/или месяцу дедлайна.
+
+    Рядом с шардами лежит manifest.json: по какому полю разбиты задачи,
+    какой файл отвечает за какое значение и сколько в нем задач. Запрос с
+    фильтром по категории или дедлайну читает только подходящие шарды, а
+    изменение перезаписывает только шарды измененных задач.
+    """
+
+    PARTITIONS = ("category", "month")
+    MANIFEST_VERSION = 1
+    PARALLEL_BYTES = 4 * 1024 * 1024  # С какого общего размера шардов загружать их в несколько процессов
+
+    def __init__(
+        self,
+        directory="tasks.shards",
+        partition: Iterable[str] = ("category",),
+        source: str | None = None,
+        workers: int | None = None,
+    ):
+        """
+        Args:
+            directory (str): Папка с шардами и манифестом
+            partition (Iterable[str]): Поля разбиения - category и/или month.
+                Используется при создании хранилища, дальше берется из манифеста
+            source (str | None): Json файл, из которого переносятся задачи при создании хранилища
+            workers (int | None): Количество процессов для загрузки. По умолчанию - по числу ядер
+        """
+        self.directory = directory
+        self.manifest_filename = os.path.join(directory, "manifest.json")
+        self.file_lock = FileLock(os.path.join(directory, "manifest.lock"))
+        self.workers = workers
+        # Шард каждой загруженной задачи, чтобы знать, откуда убрать измененную задачу
+        self.locations: dict[int, str] = {}
+        os.makedirs(directory, exist_ok=True)
+        with self.lock():
+            if not os.path.exists(self.manifest_filename):
+                partition = list(partition)
+                for field in partition:
+                    if field not in self.PARTITIONS:
+                        raise ValueError(f"Неизвестное поле разбиения: {field}")
+                self.manifest = {
+                    "version": self.MANIFEST_VERSION,
+                    "partition": partition,
+                    "next_id": 1,
+                    "shards": {},
+                }
+                tasks = JsonStorage(source).load() if source and os.path.exists(source) else []
+                self.save(tasks)
+            self.read_manifest()
+
+    def read_manifest(self) -> None:
+        with open(self.manifest_filename, "r", encoding="utf-8") as file:
+            self.manifest = json.load(file)
+
+    def write_manifest(self) -> None:
+        with atomic_open(self.manifest_filename) as file:
+            json.dump(self.manifest, file, ensure_ascii=False, indent=4)
+
+    def shard_values(self, task: Task) -> dict[str, str]:
+        """Значения полей разбиения для задачи
+
+        Args:
+            task (Task): Задача
+
+        Returns:
+            dict[str, str]: Например {"category": "работа", "month": "2024-11"}
+        """
+        values = {}
+        for field in self.manifest["partition"]:
+            if field == "category":
+                values[field] = task.category
+            else:
+                due_date = task.due_date
+                values[field] = due_date[:7] if due_date else None
+        return values
+
+    def shard_key(self, task: Task) -> str:
+        """Название шарда задачи, например работа, 2024-11 или работа/2024-11
+
+        Args:
+            task (Task): Задача
+
+        Returns:
+            str: Название шарда
+        """
+        return "/".join(value or "без срока" for value in self.shard_values(task).values())
+
+    def shard_filename(self, key: str) -> str:
+        return os.path.join(self.directory, self.manifest["shards"][key]["file"])
+
+    def shard_files(self, keys: Iterable[str] | None = None) -> list[str]:
+        keys = self.manifest["shards"] if keys is None else keys
+        return [self.shard_filename(key) for key in keys if key in self.manifest["shards"]]
+
+    def stamp(self) -> tuple:
+        stamp = []
+        for filename in [self.manifest_filename] + self.shard_files():
+            try:
+                stat = os.stat(filename)
+                stamp.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def lock(self) -> FileLock:
+        return self.file_lock
+
+    def sidecar(self, suffix: str) -> str:
+        # Служебные файлы лежат рядом с папкой шардов, а не внутри нее
+        return self.directory.rstrip("/" + os.sep) + suffix
+
+    def parallel_workers(self, filenames: list[str]) -> int:
+        """Количество процессов для загрузки шардов
+
+        Args:
+            filenames (list[str]): Файлы шардов
+
+        Returns:
+            int: Количество процессов, меньше 2 - читать в текущем процессе
+        """
+        workers = min(len(filenames), self.workers or os.cpu_count() or 1)
+        # Запуск процессов окупается только на нескольких ядрах и больших шардах
+        if workers < 2 or sum(os.path.getsize(filename) for filename in filenames) < self.PARALLEL_BYTES:
+            return 1
+        return workers
+
+    def load_shards(self, keys: Iterable[str] | None = None) -> list[list[Task]]:
+        """Загрузка шардов. Крупные наборы шардов читаются параллельно в пуле процессов
+
+        Args:
+            keys (Iterable[str] | None): Названия шардов. По умолчанию - все
+
+        Returns:
+            list[list[Task]]: Задачи каждого шарда в порядке айди
+        """
+        filenames = self.shard_files(keys)
+        workers = self.parallel_workers(filenames)
+        if workers < 2:
+            return [JsonStorage(filename).load() for filename in filenames]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            shards = executor.map(load_shard_rows, filenames)
+            return [[Task.from_row(row) for row in marshal.loads(rows)] for rows in shards]
+
+    def load(self) -> list[Task]:
+        self.read_manifest()
+        shards = self.load_shards()
+        self.locations = {}
+        for key, tasks in zip(self.manifest["shards"], shards):
+            for task in tasks:
+                self.locations[task.task_id] = key
+        return list(heapq.merge(*shards, key=lambda task: task.task_id))
+
+    def iter_tasks(self) -> Iterator[Task]:
+        """Обход всех задач, например для полного list.
+
+        Крупные наборы шардов загружаются параллельно в пуле процессов, как в
+        load, мелкие читаются потоково без загрузки в память.
+        """
+        self.read_manifest()
+        filenames = self.shard_files()
+        if self.parallel_workers(filenames) > 1:
+            shards = self.load_shards()
+        else:
+            shards = [JsonStorage(filename).iter_tasks() for filename in filenames]
+        return heapq.merge(*shards, key=lambda task: task.task_id)
+
+    def query(self, query: Query) -> list[Task]:
+        """Запрос читает только шарды, которые могут содержать подходящие задачи"""
+        self.read_manifest()
+        keys = [key for key in self.manifest["shards"] if self.shard_matches(key, query)]
+        query.plan = f"shards:{len(keys)}/{len(self.manifest['shards'])}"
+        shards = [JsonStorage(filename).iter_tasks() for filename in self.shard_files(keys)]
+        return query.apply(heapq.merge(*shards, key=lambda task: task.task_id))
+
+    def shard_matches(self, key: str, query: Query) -> bool:
+        """Может ли шард содержать задачи, подходящие под запрос
+
+        Args:
+            key (str): Название шарда
+            query (Query): Запрос
+
+        Returns:
+            bool: False, если шард точно не нужен
+        """
+        shard = self.manifest["shards"][key]
+        categories = query.filters["category"]
+        if "category" in shard and categories is not None and shard["category"] not in categories:
+            return False
+        if "month" in shard and (query.due_from is not None or query.due_to is not None):
+            if shard["month"] is None:
+                return False
+            first = date.fromisoformat(f"{shard['month']}-01")
+            last = date(first.year + first.month // 12, first.month % 12 + 1, 1).toordinal() - 1
+            if query.due_from is not None and last < query.due_from:
+                return False
+            if query.due_to is not None and first.toordinal() > query.due_to:
+                return False
+        return True
+
+    def write_shards(self, tasks: Iterable[Task], keys: set[str] | None = None) -> None:
+        """Перезапись шардов из полного списка задач
+
+        Args:
+            tasks (Iterable[Task]): Все задачи
+            keys (set[str] | None): Какие шарды перезаписать. По умолчанию - все
+        """
+        groups: dict[str, list[Task]] = {}
+        for task in tasks:
+            key = self.shard_key(task)
+            if keys is None or key in keys:
+                groups.setdefault(key, []).append(task)
+            self.locations[task.task_id] = key
+            self.manifest["next_id"] = max(self.manifest["next_id"], task.task_id + 1)
+        shards = self.manifest["shards"]
+        for key in keys if keys is not None else set(shards) | set(groups):
+            shard_tasks = groups.get(key, [])
+            if key not in shards:
+                if not shard_tasks:
+                    continue
+                number = max((int(shard["file"][6:-5]) for shard in shards.values()), default=0) + 1
+                shards[key] = {"file": f"shard-{number:04}.json", "count": 0}
+                shards[key].update(self.shard_values(shard_tasks[0]))
+            filename = self.shard_filename(key)
+            if not shard_tasks:
+                # Пустой шард удаляется вместе с кешем
+                for path in (filename, os.path.splitext(filename)[0] + ".cache"):
+                    if os.path.exists(path):
+                        os.remove(path)
+                del shards[key]
+                continue
+            JsonStorage(filename).save(shard_tasks)
+            shards[key]["count"] = len(shard_tasks)
+        self.write_manifest()
+
+    def save(self, tasks: Iterable[Task]) -> None:
+        self.locations = {}
+        self.write_shards(tasks)
+
+    def commit(self, tasks: Iterable[Task], changes: list[tuple[str, Task]]) -> None:
+        """Перезапись только шардов, в которых задачи были до изменения и оказались после"""
+        keys = set()
+        for op, task in changes:
+            if task.task_id in self.locations:
+                keys.add(self.locations.pop(task.task_id))
+            if op != "delete":
+                keys.add(self.shard_key(task))
+        self.write_shards(tasks, keys)
+
+    def next_id(self) -> int:
+        self.read_manifest()
+        return self.manifest["next_id"]
@@ -1,7 +1,87 @@
-from datetime import datetime
+from datetime import date, datetime
+
+
+STATUSES = ["не выполнено", "в процессе", "выполнено"]
+PRIORITIES = ["низкий", "средний", "высокий"]
+CATEGORIES = ["обучение", "личное", "работа", "дом"]
+OPEN_STATUSES = ("не выполнено", "в процессе")
+
+
+class Vocabulary:
+    """Словарь значений поля с небольшими целочисленными кодами.
+
+    Значения из фиксированного списка получают коды по порядку, поэтому
+    сравнение и сортировка по коду совпадают с порядком списка
+    (например, низкий < средний < высокий). Новые значения дописываются в конец.
+    """
+
+    __slots__ = ("values", "codes")
+
+    def __init__(self, values: list[str]):
+        self.values = list(values)
+        self.codes = {value: code for code, value in enumerate(self.values)}
+
+    def code(self, value: str) -> int:
+        """Код значения. Неизвестное значение добавляется в словарь
+
+        Args:
+            value (str): Значение поля
+
+        Returns:
+            int: Код значения
+        """
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+STATUS_CODES = Vocabulary(STATUSES)
+PRIORITY_CODES = Vocabulary(PRIORITIES)
+CATEGORY_CODES = Vocabulary(CATEGORIES)
+
+
+def date_to_ordinal(value: datetime | date | str | None) -> int | None:
+    """Перевод даты в порядковый номер дня
+
+    Args:
+        value (datetime | date | str | None): Дата или строка год-месяц-день
+
+    Returns:
+        int | None: Порядковый номер дня или None, если дата не задана
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, (date, datetime)):
+        return value.toordinal()
+    # Быстрый путь для обычного формата 2024-11-29, остальное - как в strptime
+    if len(value) == 10 and value[4] == "-" and value[7] == "-":
+        try:
+            return date.fromisoformat(value).toordinal()
+        except ValueError:
+            pass
+    return datetime.strptime(value, "%Y-%m-%d").toordinal()
 
 
 class Task:
+    """Задача.
+
+    Статус, приоритет и категория хранятся кодами из словарей, дедлайн -
+    порядковым номером дня. Снаружи поля по-прежнему читаются и задаются строками.
+    """
+
+    __slots__ = (
+        "task_id",
+        "title",
+        "description",
+        "status_code",
+        "priority_code",
+        "category_code",
+        "due_ordinal",
+        "completed_ordinal",
+    )
+
     def __init__(
         self,
         task_id: int,
@@ -11,6 +91,7 @@ class Task:
         priority: str = "низкий",
         category: str = "личное",
         due_date: datetime | str = None,
+        completed_at: date | str | None = None,
     ):
         self.task_id = task_id
         self.title = title.lower()
@@ -18,11 +99,57 @@ class Task:
         self.status = status.lower()
         self.priority = priority.lower()
         self.category = category.lower()
-        self.due_date = (
-            due_date.strftime("%Y-%m-%d")
-            if isinstance(due_date, datetime)
-            else due_date
-        )
+        self.due_date = due_date
+        if completed_at is not None:
+            self.completed_at = completed_at
+
+    @property
+    def status(self) -> str:
+        return STATUS_CODES.values[self.status_code]
+
+    @status.setter
+    def status(self, value: str) -> None:
+        code = STATUS_CODES.code(value)
+        # Дата выполнения ставится при переходе в "выполнено" и сбрасывается при возврате
+        if code != getattr(self, "status_code", None):
+            self.completed_ordinal = date.today().toordinal() if value == "выполнено" else None
+        self.status_code = code
+
+    @property
+    def priority(self) -> str:
+        return PRIORITY_CODES.values[self.priority_code]
+
+    @priority.setter
+    def priority(self, value: str) -> None:
+        self.priority_code = PRIORITY_CODES.code(value)
+
+    @property
+    def category(self) -> str:
+        return CATEGORY_CODES.values[self.category_code]
+
+    @category.setter
+    def category(self, value: str) -> None:
+        self.category_code = CATEGORY_CODES.code(value)
+
+    @property
+    def due_date(self) -> str | None:
+        if self.due_ordinal is None:
+            return None
+        return date.fromordinal(self.due_ordinal).isoformat()
+
+    @due_date.setter
+    def due_date(self, value: datetime | date | str | None) -> None:
+        self.due_ordinal = date_to_ordinal(value)
+
+    @property
+    def completed_at(self) -> str | None:
+        if self.completed_ordinal is None:
+            return None
+        return date.fromordinal(self.completed_ordinal).isoformat()
+
+    @completed_at.setter
+    def completed_at(self, value: datetime | date | str | None) -> None:
+        self.completed_ordinal = date_to_ordinal(value)
 
     def to_dict(self) -> dict:
         """Вывод задачи в виде словаря для сохранения в json виде
@@ -30,7 +157,7 @@ class Task:
         Returns:
             dict: Представление задачи в виде словаря
         """
-        return {
+        data = {
             "task_id": self.task_id,
             "title": self.title,
             "description": self.description,
@@ -39,6 +166,100 @@ class Task:
             "priority": self.priority,
             "status": self.status,
         }
+        if self.completed_ordinal is not None:
+            data["completed_at"] = self.completed_at
+        return data
+
+    def to_row(self) -> tuple:
+        """Вывод задачи в виде кортежа для бинарного кеша
+
+        Returns:
+            tuple: Айди, название, описание, категория, дедлайн (номер дня), приоритет,
+                статус, дата выполнения (номер дня)
+        """
+        return (
+            self.task_id,
+            self.title,
+            self.description,
+            self.category,
+            self.due_ordinal,
+            self.priority,
+            self.status,
+            self.completed_ordinal,
+        )
+
+    @classmethod
+    def from_row(cls, row: tuple):
+        """Создание задачи из кортежа to_row без повторной обработки полей
+
+        Args:
+            row (tuple): Кортеж из to_row. В кортежах старого формата нет даты выполнения
+
+        Returns:
+            Task: Возвращает задачу
+        """
+        task = cls.__new__(cls)
+        (
+            task.task_id,
+            task.title,
+            task.description,
+            category,
+            task.due_ordinal,
+            priority,
+            status,
+        ) = row[:7]
+        task.completed_ordinal = row[7] if len(row) > 7 else None
+        task.category_code = CATEGORY_CODES.code(category)
+        task.priority_code = PRIORITY_CODES.code(priority)
+        task.status_code = STATUS_CODES.code(status)
+        return task
+
+    def to_codes(self) -> list:
+        """Вывод задачи строкой для Json файла: статус, приоритет и категория - кодами словарей
+
+        Returns:
+            list: Айди, название, описание, код категории, дедлайн (номер дня), код приоритета,
+                код статуса, дата выполнения (номер дня)
+        """
+        return [
+            self.task_id,
+            self.title,
+            self.description,
+            self.category_code,
+            self.due_ordinal,
+            self.priority_code,
+            self.status_code,
+            self.completed_ordinal,
+        ]
+
+    @classmethod
+    def from_codes(cls, row: list, categories: list[int], priorities: list[int], statuses: list[int]):
+        """Создание задачи из строки to_codes
+
+        Args:
+            row (list): Строка из to_codes
+            categories (list[int]): Код категории в файле - код в CATEGORY_CODES
+            priorities (list[int]): Код приоритета в файле - код в PRIORITY_CODES
+            statuses (list[int]): Код статуса в файле - код в STATUS_CODES
+
+        Returns:
+            Task: Возвращает задачу
+        """
+        task = cls.__new__(cls)
+        (
+            task.task_id,
+            task.title,
+            task.description,
+            category,
+            task.due_ordinal,
+            priority,
+            status,
+            task.completed_ordinal,
+        ) = row
+        task.category_code = categories[category]
+        task.priority_code = priorities[priority]
+        task.status_code = statuses[status]
+        return task
 
     @classmethod
     def from_dict(cls, data):
@@ -50,7 +271,7 @@ class Task:
         Returns:
             Task: Возвращает задачу
         """
-        return cls(
+        task = cls(
             task_id=data["task_id"],
             title=data["title"],
             description=data["description"],
@@ -59,3 +280,6 @@ class Task:
             priority=data["priority"],
             status=data["status"],
         )
+        # У задач, сохраненных до появления даты выполнения, она неизвестна
+        task.completed_at = data.get("completed_at")
+        return task
@@ -1,59 +1,550 @@
-import os
-import json
-from datetime import datetime, timedelta
-from task import Task
-import utils
+import heapq
+import bisect
+from contextlib import contextmanager, nullcontext
+from datetime import date, datetime, timedelta
+from typing import Callable, Iterable, Iterator
+import profiling
+from task import Task, OPEN_STATUSES
+from query import Query
+from search_index import SearchIndex
+from archive import Archive, ARCHIVE_AGE
+from changes import ChangeFeed, Replica
+from storage import JsonStorage, Storage, JOURNAL_LIMIT
+
+
+INDEXED_FIELDS = ("category", "status", "priority")
+EDITABLE_FIELDS = ("title", "description", "category", "due_date", "priority", "status")
 
 
 class TaskManager:
-    def __init__(self, filename="tasks.json"):
+    def __init__(
+        self,
+        filename="tasks.json",
+        journal: bool = False,
+        journal_limit: int = JOURNAL_LIMIT,
+        storage: Storage | None = None,
+        lazy: bool = False,
+        hooks: Iterable[profiling.Hook] = (),
+    ):
+        """
+        Args:
+            filename (str): Json файл с задачами, если storage не задан
+            journal (bool): Сохранять изменения в журнал вместо полной перезаписи файла
+            journal_limit (int): Размер журнала, после которого он сворачивается в снапшот
+            storage (Storage | None): Хранилище задач. По умолчанию - JsonStorage(filename)
+            lazy (bool): Не загружать задачи при создании. Запросы на чтение будут
+                потоково читать хранилище, а загрузка произойдет при первом изменении
+            hooks (Iterable[profiling.Hook]): Подписчики на замеры фаз, см. subscribe
+        """
         self.filename = filename
-        self.tasks = []
-        self.collect_tasks()
+        self.storage = storage or JsonStorage(filename, journal, journal_limit)
+        self.hooks: list[profiling.Hook] = []
+        for hook in hooks:
+            self.subscribe(hook)
+        self.task_map: dict[int, Task] = {}
+        self.indexes: dict[str, dict[str, set[int]]] = {
+            field: {} for field in INDEXED_FIELDS
+        }
+        # Отсортированные пары (дедлайн, айди) невыполненных задач
+        self.deadlines: list[tuple[int, int]] = []
+        # Полнотекстовый индекс, загружается при первом поиске
+        self.search_index: SearchIndex | None = None
+        # Служебные файлы лежат рядом с хранилищем, а не рядом с filename:
+        # иначе менеджер с другим хранилищем писал бы в файлы tasks.json
+        self.search_filename = self.storage.sidecar(".search")
+        # Давно выполненные задачи переносятся в сжатый архив и не загружаются вместе с остальными
+        self.archive = Archive(self.storage.sidecar(".archive.gz"), self.storage.sidecar(".archive.id"))
+        # Лента изменений с порядковыми номерами для реплик и внешних потребителей
+        self.changes = ChangeFeed(self.storage.sidecar(".changes"))
+        self.loaded = False
+        self.stamp = None
+        self.max_id = 0
+        self.pending: list[tuple[str, Task]] | None = None
+        if not lazy:
+            self.collect_tasks()
+
+    def subscribe(self, hook: profiling.Hook) -> None:
+        """Подписка на замеры фаз: load, parse, construct, query, render, save и других.
+
+        Пока подписчиков нет, замеры не выполняются.
+
+        Args:
+            hook (profiling.Hook): Функция, которая получит название фазы,
+                время в секундах и прирост памяти в байтах
+        """
+        self.hooks.append(hook)
+        self.storage.phase = self.phase
+
+    def emit(self, name: str, seconds: float, allocated: int | None) -> None:
+        for hook in self.hooks:
+            hook(name, seconds, allocated)
+
+    def phase(self, name: str):
+        """Замер фазы для подписчиков
+
+        Args:
+            name (str): Название фазы
+
+        Returns:
+            Контекстный менеджер замера
+        """
+        if not self.hooks:
+            return nullcontext()
+        return profiling.measure(name, self.emit)
+
+    def stream(self, name: str, items: Iterable) -> Iterable:
+        """Замер фазы, которая идет потоком, например чтения задач по мере вывода
+
+        Args:
+            name (str): Название фазы
+            items (Iterable): Поток
+
+        Returns:
+            Iterable: Тот же поток, без подписчиков - без обертки
+        """
+        if not self.hooks:
+            return items
+        return profiling.measure_iter(name, items, self.emit)
+
+    @property
+    def tasks(self) -> list[Task]:
+        """Список задач в порядке добавления"""
+        return list(self.task_map.values())
+
+    @tasks.setter
+    def tasks(self, tasks: list[Task]) -> None:
+        self.task_map = {}
+        self.indexes = {field: {} for field in INDEXED_FIELDS}
+        self.deadlines = []
+        self.search_index = None
+        for task in tasks:
+            self.task_map[task.task_id] = task
+            self.index_task(task, deadline=False)
+        self.deadlines = sorted(
+            key for key in map(self.deadline_key, self.task_map.values()) if key
+        )
+        self.max_id = max(max(self.task_map, default=0), self.archive.max_id())
 
     def collect_tasks(self) -> None:
-        """Сбор задач из Json файла"""
-        if os.path.exists(self.filename):
-            with open(self.filename, "r", encoding="utf-8") as file:
-                data = json.load(file)
-                self.tasks = [Task.from_dict(task) for task in data]
+        """Сбор задач из хранилища и построение индексов. Ленивые хранилища не загружаются целиком"""
+        if not self.storage.lazy:
+            # Отметка берется до чтения: если файл поменяют во время загрузки,
+            # она не совпадет и задачи перечитаются перед следующим изменением
+            stamp = self.storage.stamp()
+            with self.phase("load"):
+                tasks = self.storage.load()
+            with self.phase("index"):
+                self.tasks = tasks
+            self.loaded = True
+            self.stamp = stamp
+
+    def refresh(self) -> None:
+        """Перезагрузка задач, если хранилище изменил другой процесс.
+
+        Несохраненные изменения открытой пачки применяются заново поверх
+        перечитанных задач, поэтому следующая запись не затрет чужие изменения.
+        """
+        if not self.loaded or self.storage.stamp() == self.stamp:
+            return
+        pending = self.pending
+        self.collect_tasks()
+        if pending:
+            self.pending = self.replay(pending)
+
+    def replay(self, changes: list[tuple[str, Task]]) -> list[tuple[str, Task]]:
+        """Применение несохраненных изменений к только что перечитанным задачам
+
+        Args:
+            changes (list[tuple[str, Task]]): Изменения пачки
+
+        Returns:
+            list[tuple[str, Task]]: Изменения, которые по-прежнему нужно сохранить
+        """
+        replayed = []
+        for op, task in changes:
+            current = self.task_map.get(task.task_id)
+            if op == "add" and current is not None and current is not task:
+                # Айди новой задачи успел занять другой процесс
+                self.max_id += 1
+                task.task_id = self.max_id
+                current = None
+            elif op != "add" and current is None:
+                # Задачу удалил другой процесс
+                continue
+            if current is not None:
+                self.unindex_task(current)
+            if op == "delete":
+                del self.task_map[task.task_id]
+            else:
+                self.task_map[task.task_id] = task
+                self.index_task(task)
+                self.max_id = max(self.max_id, task.task_id)
+            replayed.append((op, task))
+        return replayed
+
+    def reserve_ids(self, changes: list[tuple[str, Task]]) -> list[tuple[str, Task]]:
+        """Проверка несохраненных изменений по ленивому хранилищу перед записью.
+
+        Ленивое хранилище не перечитывается целиком, поэтому проверяются только
+        айди: новая задача, чей айди успел занять другой процесс, получает новый,
+        иначе запись затерла бы чужую задачу. Изменения задач, которые удалил
+        другой процесс, пропускаются. Вызывается под блокировкой хранилища.
+
+        Args:
+            changes (list[tuple[str, Task]]): Изменения пачки
+
+        Returns:
+            list[tuple[str, Task]]: Изменения, которые по-прежнему нужно сохранить
+        """
+        next_id = self.storage.next_id()
+        added = set()
+        reserved = []
+        for op, task in changes:
+            if op == "add":
+                if task.task_id < next_id and self.storage.get(task.task_id) is not None:
+                    self.max_id = max(self.max_id, next_id - 1, self.archive.max_id()) + 1
+                    task.task_id = self.max_id
+                added.add(task.task_id)
+            elif task.task_id not in added and self.storage.get(task.task_id) is None:
+                continue
+            reserved.append((op, task))
+        return reserved
+
+    def load_for_write(self) -> None:
+        """Загрузка задач перед изменением, если менеджер был создан лениво"""
+        if not self.loaded:
+            self.collect_tasks()
+
+    @staticmethod
+    def deadline_key(task: Task) -> tuple[int, int] | None:
+        """Ключ задачи в индексе дедлайнов
+
+        Args:
+            task (Task): Задача
+
+        Returns:
+            tuple[int, int] | None: Дедлайн и айди или None, если задача выполнена или без дедлайна
+        """
+        if task.due_ordinal is None or task.status not in OPEN_STATUSES:
+            return None
+        return (task.due_ordinal, task.task_id)
+
+    def index_task(self, task: Task, deadline: bool = True) -> None:
+        """Добавление задачи в индексы по категории, статусу, приоритету и дедлайну
+
+        Args:
+            task (Task): Задача
+            deadline (bool): Добавлять ли задачу в индекс дедлайнов
+        """
+        for field in INDEXED_FIELDS:
+            self.indexes[field].setdefault(getattr(task, field), set()).add(task.task_id)
+        key = self.deadline_key(task) if deadline else None
+        if key:
+            bisect.insort(self.deadlines, key)
+        if self.search_index is not None:
+            self.search_index.add(task)
+
+    def unindex_task(self, task: Task) -> None:
+        """Удаление задачи из индексов по категории, статусу, приоритету и дедлайну
+
+        Args:
+            task (Task): Задача
+        """
+        for field in INDEXED_FIELDS:
+            ids = self.indexes[field].get(getattr(task, field))
+            if ids is not None:
+                ids.discard(task.task_id)
+                if not ids:
+                    del self.indexes[field][getattr(task, field)]
+        key = self.deadline_key(task)
+        if key:
+            position = bisect.bisect_left(self.deadlines, key)
+            if position < len(self.deadlines) and self.deadlines[position] == key:
+                del self.deadlines[position]
+        if self.search_index is not None:
+            self.search_index.remove(task)
+
+    def get_search_index(self) -> SearchIndex:
+        """Полнотекстовый индекс: с диска вместе с журналом изменений, если они соответствуют хранилищу,
+        иначе строится заново
+
+        Returns:
+            SearchIndex: Индекс по названиям и описаниям задач
+        """
+        if self.search_index is None:
+            # У ленивых хранилищ задачи не загружены, отметка берется у хранилища до чтения задач
+            stamp = self.stamp if self.loaded else self.storage.stamp()
+            search_index = SearchIndex(self.search_filename)
+            if not search_index.load(stamp):
+                tasks = self.task_map.values() if self.loaded else self.storage.iter_tasks()
+                search_index.build(tasks)
+                search_index.save(stamp)
+            elif search_index.needs_compaction():
+                # Журнал сворачивается под блокировкой, чтобы не потерять дописанные в него изменения
+                with self.storage.lock():
+                    if self.storage.stamp() == stamp:
+                        search_index.save(stamp)
+            self.search_index = search_index
+        return self.search_index
+
+    def search(self, text: str, limit: int | None = None) -> list[Task]:
+        """Поиск задач по словам из названия и описания
+
+        Args:
+            text (str): Слова запроса, каждое может быть началом слова
+            limit (int | None): Максимальное количество задач
+
+        Returns:
+            list[Task]: Задачи от наиболее подходящих к наименее подходящим
+        """
+        with self.phase("query"):
+            results = self.get_search_index().search(text)[:limit]
+            return [self.find_task(task_id) for task_id, _ in results]
+
+    def commit(self, op: str, task: Task) -> None:
+        """Сохранение одного изменения: в текущую пачку или сразу в хранилище
+
+        Args:
+            op (str): Тип изменения - add, update или delete
+            task (Task): Измененная задача
+        """
+        if self.pending is not None:
+            self.pending.append((op, task))
+            return
+        with self.storage.lock(), self.phase("save"), self.changes.record([(op, task)]):
+            before = self.storage.stamp()
+            self.storage.commit(self.task_map.values(), [(op, task)])
+            self.saved([(op, task)], before)
+
+    def saved(self, changes: list[tuple[str, Task]] = (), before=None) -> None:
+        """Обновление отметки хранилища и индекса поиска после записи
+
+        Args:
+            changes (list[tuple[str, Task]]): Сохраненные изменения
+            before: Отметка хранилища до записи. Без нее индекс на диске перестроится при поиске
+        """
+        self.stamp = self.storage.stamp()
+        # Изменения дописываются в журнал индекса поиска, и следующий поиск
+        # применяет их к индексу на диске, а не строит его заново
+        SearchIndex(self.search_filename).log(before, self.stamp, changes)
+        if self.search_index is not None and not self.loaded:
+            # Без загруженных задач индекс в памяти не обновлялся при изменениях
+            self.search_index.apply(SearchIndex.documents(changes))
+
+    def begin_batch(self) -> None:
+        """Начало накопления изменений. Они будут сохранены вызовом flush"""
+        if self.pending is None:
+            self.pending = []
+
+    def flush(self) -> None:
+        """Сохранение всех накопленных изменений одной записью в хранилище"""
+        if not self.pending:
+            return
+        with self.storage.lock():
+            # Полная перезапись идет из памяти, поэтому сначала подтягиваются чужие изменения
+            self.refresh()
+            if not self.loaded:
+                self.pending = self.reserve_ids(self.pending)
+            changes, self.pending = self.pending, []
+            if not changes:
                 return
-        with open(self.filename, "w", encoding="utf-8") as file:
-            json.dump([], file)
-
-    def list_tasks(self):
-        data = [
-            [
-                "ID",
-                "Задача",
-                "Описание",
-                "Категория",
-                "Срок выполнения",
-                "Приоритет",
-                "Статус",
-            ]
-        ]
-        if len(self.tasks) > 0:
-            for task in self.tasks:
-                data.append(
-                    [
-                        task.task_id,
-                        task.title,
-                        task.description,
-                        task.category,
-                        task.due_date,
-                        task.priority,
-                        task.status,
-                    ]
-                )
-            utils.pretty_print(data)
+            with self.phase("save"), self.changes.record(changes):
+                before = self.storage.stamp()
+                self.storage.commit(self.task_map.values(), changes)
+                self.saved(changes, before)
+
+    @contextmanager
+    def batch(self):
+        """Изменение задач под межпроцессной блокировкой хранилища.
+
+        Перед изменением задачи перечитываются, если их успел поменять другой
+        процесс, а все изменения внутри with сохраняются одной записью.
+        Вложенные batch входят в уже открытую пачку. Задачи перечитываются и
+        при открытой пачке: сервер держит ее между командами, отпуская блокировку.
+        Ошибка во вложенном batch отменяет только его изменения.
+        """
+        with self.storage.lock():
+            self.load_for_write()
+            self.refresh()
+            if self.pending is not None:
+                savepoint = len(self.pending)
+                try:
+                    yield
+                except BaseException:
+                    if len(self.pending) > savepoint:
+                        # Задачи в памяти возвращаются к сохраненным плюс изменения пачки до этого batch
+                        pending = self.pending[:savepoint]
+                        self.pending = None
+                        self.collect_tasks()
+                        self.pending = self.replay(pending) if self.loaded else pending
+                    raise
+                return
+            self.begin_batch()
+            try:
+                yield
+            except BaseException:
+                # Пачка, прерванная ошибкой, не сохраняется, а задачи в памяти возвращаются к сохраненным
+                self.pending = None
+                self.collect_tasks()
+                raise
+            try:
+                self.flush()
+            finally:
+                self.pending = None
+
+    def find_task(self, task_id: int) -> Task | None:
+        """Поиск задачи по айди в памяти или в хранилище
+
+        Args:
+            task_id (int): Айди задачи
+
+        Returns:
+            Task | None: Задача или None, если не найдена
+        """
+        if not self.loaded:
+            return self.storage.get(task_id)
+        return self.task_map.get(task_id)
+
+    def iter_all(self, include_archived: bool = False) -> Iterable[Task]:
+        """Все задачи в порядке айди, при необходимости вместе с архивом
+
+        Args:
+            include_archived (bool): Добавить задачи из архива
+
+        Returns:
+            Iterable[Task]: Задачи
+        """
+        if self.loaded:
+            # Обход идет по снимку айди, поэтому задачи можно добавлять и удалять во
+            # время обхода. Удаленные задачи пропускаются, новые не попадают в обход
+            tasks = filter(None, map(self.task_map.get, list(self.task_map)))
         else:
-            print([])
+            # Задачи читаются по мере вывода, чтение замеряется отдельно от вывода
+            tasks = self.stream("load", self.storage.iter_tasks())
+        if not include_archived:
+            return tasks
+        return heapq.merge(tasks, self.archive.load(), key=lambda task: task.task_id)
+
+    def list_tasks(self, include_archived: bool = False) -> Iterator[Task]:
+        """Ленивый обход всех задач. Если задачи не загружены, хранилище читается потоково
+
+        Args:
+            include_archived (bool): Добавить задачи из архива
+
+        Returns:
+            Iterator[Task]: Задачи в порядке айди
+        """
+        return iter(self.iter_all(include_archived))
+
+    def query(self, query: Query | None = None, include_archived: bool = False, **params) -> list[Task]:
+        """Поиск задач по фильтрам с сортировкой и срезом.
+
+        Если задачи загружены, запрос использует самый селективный индекс,
+        иначе фильтры применяются к хранилищу. Архив просматривается целиком.
+
+        Args:
+            query (Query | None): Готовый запрос
+            include_archived (bool): Искать и среди задач из архива
+            **params: Параметры Query, если запрос не передан
+
+        Returns:
+            list[Task]: Подходящие задачи
+        """
+        query = query or Query(**params)
+        with self.phase("query"):
+            if include_archived:
+                query.plan = "archive"
+                return query.apply(self.iter_all(include_archived=True))
+            if self.loaded:
+                return query.run(self.task_map, self.indexes, self.deadlines)
+            return self.storage.query(query)
+
+    def changes_since(self, seq: int = 0) -> Iterator[dict]:
+        """Изменения задач с номером больше seq, см. ChangeFeed
+
+        Args:
+            seq (int): Номер последнего уже полученного изменения
+
+        Yields:
+            dict: Изменение - seq, op и task или task_id
+        """
+        return self.changes.since(seq)
+
+    def replicate(self, replica: Replica) -> int:
+        """Перенос в реплику изменений, которых в ней еще нет.
+
+        Новая реплика (или отставшая дальше начала ленты) сначала заполняется
+        всеми задачами целиком, дальше применяются только новые изменения.
+
+        Args:
+            replica (Replica): Реплика
+
+        Returns:
+            int: Количество перенесенных изменений или задач при полном копировании
+        """
+        seq = replica.seq()
+        if seq is None or seq < self.changes.first_seq() - 1:
+            # Под блокировкой, чтобы задачи и номер последнего изменения соответствовали друг другу
+            with self.storage.lock():
+                self.refresh()
+                tasks = list(self.iter_all())
+                replica.reset(tasks, self.changes.last_seq())
+            return len(tasks)
+        return replica.apply(self.changes.since(seq))
+
+    def deadline_range(self, first: int | None, last: int | None) -> list[Task]:
+        """Невыполненные задачи с дедлайном в диапазоне, по возрастанию дедлайна.
+
+        Для загруженных задач - бинарный поиск по индексу дедлайнов, O(log N + k).
+
+        Args:
+            first (int | None): Первый день диапазона (номер дня), None - без ограничения
+            last (int | None): Последний день диапазона (номер дня), None - без ограничения
+
+        Returns:
+            list[Task]: Задачи из диапазона
+        """
+        if not self.loaded:
+            return self.query(
+                status=OPEN_STATUSES,
+                due_from=date.fromordinal(first) if first is not None else None,
+                due_to=date.fromordinal(last) if last is not None else None,
+                sort=["due_date", "id"],
+            )
+        start = 0 if first is None else bisect.bisect_left(self.deadlines, (first,))
+        stop = len(self.deadlines) if last is None else bisect.bisect_left(self.deadlines, (last + 1,))
+        return [self.task_map[task_id] for _, task_id in self.deadlines[start:stop]]
+
+    def overdue_tasks(self, today: date | None = None) -> list[Task]:
+        """Невыполненные задачи, дедлайн которых уже прошел
+
+        Args:
+            today (date | None): Текущая дата. По умолчанию - сегодня
+
+        Returns:
+            list[Task]: Просроченные задачи по возрастанию дедлайна
+        """
+        today = today or date.today()
+        return self.deadline_range(None, today.toordinal() - 1)
+
+    def upcoming_tasks(self, days: int, today: date | None = None) -> list[Task]:
+        """Невыполненные задачи с дедлайном в ближайшие days дней, включая сегодня
+
+        Args:
+            days (int): Количество дней
+            today (date | None): Текущая дата. По умолчанию - сегодня
+
+        Returns:
+            list[Task]: Задачи по возрастанию дедлайна
+        """
+        today = today or date.today()
+        return self.deadline_range(today.toordinal(), today.toordinal() + days)
 
     def save_tasks(self) -> None:
-        """Сохранение задач в Json файл"""
-        with open(self.filename, "w", encoding="utf-8") as file:
-            json.dump([task.to_dict() for task in self.tasks], file, indent=4)
+        """Полное сохранение задач в хранилище"""
+        with self.storage.lock(), self.phase("save"):
+            self.storage.save(self.task_map.values())
+            self.saved()
 
     def add_task(
         self,
@@ -63,7 +554,7 @@ class TaskManager:
         due_date: str | None,
         priority: str | None,
         status: str | None,
-    ):
+    ) -> Task:
         """Добавление задачи в список задачи класса TaskManager, с последующим сохранением в Json файл
 
         Args:
@@ -73,157 +564,274 @@ class TaskManager:
             due_date (str | None): Дедлайн
             priority (str | None): Приоритет
             status (str | None): Статус задачи
+
+        Returns:
+            Task: Созданная задача
         """
-        task_id = len(self.tasks) + 1
-        task = Task(
-            task_id=task_id,
+        return self.create_task(
             title=title,
             description=description,
-            status=status,
-            priority=priority,
             category=category,
-            due_date=datetime.fromisoformat(due_date)
-            if due_date
-            else datetime.now() + timedelta(days=1),
+            due_date=due_date,
+            priority=priority,
+            status=status,
         )
-        self.tasks.append(task)
-        self.save_tasks()
-        print(f'Задача "{task.title}" успешно создана')
-
-    def delete_task(self, task_id):
-        for i, task in enumerate(self.tasks):
-            if task.task_id == task_id:
-                print(f"Задача {task.title} удалена")
-                del self.tasks[i]
-                self.save_tasks()
-                return
-        print(f"Задача с ID {task_id} не найдена")
-
-    def get_task_by_id(self, task_id):
-        data = [
-            [
-                "ID",
-                "Задача",
-                "Описание",
-                "Категория",
-                "Срок выполнения",
-                "Приоритет",
-                "Статус",
-            ]
-        ]
-        for task in self.tasks:
-            if task.task_id == task_id:
-                data.append(
-                    [
-                        task.task_id,
-                        task.title,
-                        task.description,
-                        task.category,
-                        task.due_date,
-                        task.priority,
-                        task.status,
-                    ]
-                )
-                utils.pretty_print(data)
-                return
-        print(f"Задача с ID{task_id} не найдена.")
-
-    def get_tasks_by_category(self, category):
-        data = [
-            [
-                "ID",
-                "Задача",
-                "Описание",
-                "Категория",
-                "Срок выполнения",
-                "Приоритет",
-                "Статус",
-            ]
-        ]
-        for task in self.tasks:
-            if task.category == category.lower():
-                data.append(
-                    [
-                        task.task_id,
-                        task.title,
-                        task.description,
-                        task.category,
-                        task.due_date,
-                        task.priority,
-                        task.status,
-                    ]
-                )
-        if len(data) == 0:
-            print("Ничего не найдено.")
-            return
-        utils.pretty_print(data)
 
-    def complete_task_by_id(self, task_id):
+    def create_task(
+        self,
+        title: str,
+        description: str | None = "",
+        category: str | None = "личное",
+        due_date: str | None = None,
+        priority: str | None = "низкий",
+        status: str | None = "не выполнено",
+        completed_at: str | None = None,
+    ) -> Task:
+        """Создание задачи без вывода сообщений. Внутри batch сохраняется вместе с остальной пачкой
+
+        Args:
+            completed_at (str | None): Дата выполнения, например из импорта. Учитывается
+                только у выполненной задачи, по умолчанию - сегодня
+
+        Returns:
+            Task: Созданная задача
+        """
+        with self.batch():
+            # Айди выдается под блокировкой после перечитывания задач,
+            # поэтому параллельные процессы не получат одинаковый айди
+            if not self.loaded:
+                self.max_id = max(self.max_id, self.storage.next_id() - 1, self.archive.max_id())
+            task = Task(
+                task_id=self.max_id + 1,
+                title=title,
+                description=description,
+                status=status,
+                priority=priority,
+                category=category,
+                due_date=datetime.fromisoformat(due_date)
+                if due_date
+                else datetime.now() + timedelta(days=1),
+            )
+            if completed_at and task.status == "выполнено":
+                task.completed_at = completed_at
+            self.max_id = task.task_id
+            if self.loaded:
+                self.task_map[task.task_id] = task
+                self.index_task(task)
+            self.commit("add", task)
+        return task
+
+    def delete_task(self, task_id: int) -> Task | None:
+        """Удаление задачи
+
+        Args:
+            task_id (int): Айди задачи
+
+        Returns:
+            Task | None: Удаленная задача или None, если ее нет
+        """
+        with self.batch():
+            task = self.find_task(task_id)
+            if task is None:
+                return None
+            if self.loaded:
+                del self.task_map[task.task_id]
+                self.unindex_task(task)
+            self.commit("delete", task)
+        return task
+
+    def get_task_by_id(self, task_id: int, include_archived: bool = False) -> Task | None:
+        """Поиск задачи по айди
+
+        Args:
+            task_id (int): Айди задачи
+            include_archived (bool): Искать и в архиве
+
+        Returns:
+            Task | None: Задача или None, если она не найдена
+        """
+        with self.phase("query"):
+            task = self.find_task(task_id)
+            if task is None and include_archived:
+                task = self.archive.get(task_id)
+            return task
+
+    def get_tasks_by_category(self, category: str) -> list[Task]:
+        return self.query(category=[category])
+
+    def complete_task_by_id(self, task_id: int) -> Task | None:
         """Выполнить задачу
 
         Args:
-            task_id (_type_): Айди задачи, которая будет выполнена.
+            task_id (int): Айди задачи, которая будет выполнена.
+
+        Returns:
+            Task | None: Выполненная задача или None, если задачи нет или она уже выполнена
         """
-        data = [
-            [
-                "ID",
-                "Задача",
-                "Описание",
-                "Категория",
-                "Срок выполнения",
-                "Приоритет",
-                "Статус",
+        with self.batch():
+            task = self.find_task(task_id)
+            if task is None or task.status not in OPEN_STATUSES:
+                return None
+            if self.loaded:
+                self.unindex_task(task)
+            task.status = "выполнено"
+            if self.loaded:
+                self.index_task(task)
+            self.commit("update", task)
+        return task
+
+
+    def edit_task(self, task_id: int, edit: Callable[[Task], Task | None]) -> Task | None:
+        """Изменение задачи функцией edit, которая меняет поля копии задачи.
+
+        edit может спрашивать пользователя, поэтому вызывается без блокировки
+        хранилища. Затем задача перечитывается под блокировкой, и в нее
+        переносятся только поля, измененные в edit: изменения, которые другой
+        процесс сделал за время вопросов, не теряются.
+
+        Args:
+            task_id (int): Айди задачи, которая будет изменена
+            edit (Callable[[Task], Task | None]): Получает копию задачи, возвращает ее
+                же, если изменения нужно сохранить, или None для отмены
+
+        Returns:
+            Task | None: Измененная задача или None, если задачи нет или изменение отменено
+        """
+        task = self.find_task(task_id)
+        if task is None:
+            return None
+        draft = Task.from_dict(task.to_dict())
+        if edit(draft) is None:
+            return None
+        before, after = task.to_dict(), draft.to_dict()
+        fields = {field: after[field] for field in EDITABLE_FIELDS if after[field] != before[field]}
+        with self.batch():
+            task = self.find_task(task_id)
+            if task is None:
+                return None
+            if fields:
+                self.update_task(task, **fields)
+        return task
+
+    def select_tasks(self, ids: Iterable[int] = (), query: Query | None = None) -> tuple[list[Task], list[int]]:
+        """Выбор задач для пакетного изменения по списку айди и/или запросу
+
+        Args:
+            ids (Iterable[int]): Айди задач
+            query (Query | None): Запрос, задачи которого тоже нужно выбрать
+
+        Returns:
+            tuple[list[Task], list[int]]: Найденные задачи без повторов и айди, которых нет
+        """
+        tasks, missing = {}, []
+        for task_id in ids:
+            task = self.find_task(task_id)
+            if task is None:
+                missing.append(task_id)
+            else:
+                tasks[task_id] = task
+        if query is not None:
+            for task in self.query(query):
+                tasks.setdefault(task.task_id, task)
+        return list(tasks.values()), missing
+
+    def complete_tasks(self, ids: Iterable[int] = (), query: Query | None = None) -> tuple[list[Task], list[int]]:
+        """Выполнение нескольких задач с одним сохранением
+
+        Args:
+            ids (Iterable[int]): Айди задач
+            query (Query | None): Запрос, задачи которого тоже нужно выполнить
+
+        Returns:
+            tuple[list[Task], list[int]]: Выполненные задачи и айди, которых нет
+        """
+        with self.batch():
+            tasks, missing = self.select_tasks(ids, query)
+            # То же правило, что и в complete_task_by_id: выполнить можно любую незавершенную задачу
+            completed = [task for task in tasks if task.status in OPEN_STATUSES]
+            for task in completed:
+                self.update_task(task, status="выполнено")
+        return completed, missing
+
+    def delete_tasks(self, ids: Iterable[int] = (), query: Query | None = None) -> tuple[list[Task], list[int]]:
+        """Удаление нескольких задач с одним сохранением
+
+        Args:
+            ids (Iterable[int]): Айди задач
+            query (Query | None): Запрос, задачи которого тоже нужно удалить
+
+        Returns:
+            tuple[list[Task], list[int]]: Удаленные задачи и айди, которых нет
+        """
+        with self.batch():
+            tasks, missing = self.select_tasks(ids, query)
+            for task in tasks:
+                if self.loaded:
+                    del self.task_map[task.task_id]
+                    self.unindex_task(task)
+                self.commit("delete", task)
+        return tasks, missing
+
+    def edit_tasks(self, fields: dict, ids: Iterable[int] = (), query: Query | None = None) -> tuple[list[Task], list[int]]:
+        """Изменение полей нескольких задач без вопросов пользователю, с одним сохранением
+
+        Args:
+            fields (dict): Новые значения полей: title, description, due_date, category, priority, status
+            ids (Iterable[int]): Айди задач
+            query (Query | None): Запрос, задачи которого тоже нужно изменить
+
+        Returns:
+            tuple[list[Task], list[int]]: Измененные задачи и айди, которых нет
+        """
+        with self.batch():
+            tasks, missing = self.select_tasks(ids, query)
+            for task in tasks:
+                self.update_task(task, **fields)
+        return tasks, missing
+
+    def update_task(self, task: Task, **fields) -> None:
+        """Изменение полей задачи с обновлением индексов
+
+        Args:
+            task (Task): Задача
+            **fields: Новые значения полей
+        """
+        with self.batch():
+            if self.loaded:
+                self.unindex_task(task)
+            for field, value in fields.items():
+                setattr(task, field, value)
+            if self.loaded:
+                self.index_task(task)
+            self.commit("update", task)
+
+    def archive_tasks(self, days: int = ARCHIVE_AGE, today: date | None = None) -> list[Task]:
+        """Перенос задач, выполненных больше days дней назад, в архив.
+
+        Если дата выполнения неизвестна (задача сохранена до ее появления),
+        вместо нее берется дедлайн.
+
+        Args:
+            days (int): Сколько дней выполненная задача остается среди активных
+            today (date | None): Текущая дата. По умолчанию - сегодня
+
+        Returns:
+            list[Task]: Перенесенные задачи
+        """
+        last = (today or date.today()).toordinal() - days
+        with self.batch():
+            tasks = [
+                task
+                for task in self.iter_all()
+                if task.status == "выполнено"
+                and (task.completed_ordinal or task.due_ordinal or 0) <= last
             ]
-        ]
-
-        for task in self.tasks:
-            if task.task_id == task_id:
-                if task.status == "не выполнено":
-                    task.status = "выполнено"
-                    self.save_tasks()
-                    data.append(
-                        [
-                            task.task_id,
-                            task.title,
-                            task.description,
-                            task.category,
-                            task.due_date,
-                            task.priority,
-                            task.status,
-                        ]
-                    )
-                    utils.pretty_print(data)
-                    return
-                print("Задача уже выполнена.")
-                return
-        if len(data) == 1:
-            print(f"Задача с ID {task_id} не найдена.")
-
-
-    def edit_task(self, task_id:int):
-        """Изменение задачи
-
-        Args:
-            task_id (_type_): Айди задачи, которая будет изменена
-        """
-        for task in self.tasks:
-            if task.task_id == task_id:
-                user_choice = input("""Что изменяем? 
-1 - Название
-2 - Описание
-3 - Дедлайн
-4 - Категория
-5 - Приоритет
-6 - Статус выполнения
-7 - Всю задачу
-8 - Отмена
-Введите: """)
-                task = utils.answer_user_edit_info(task,int(user_choice))
-                if task is not None:
-                    self.save_tasks()
-                    print(f"Задача '{task.title}' успешно изменена.")
-                    return
-                else:
-                    return
-            
-        print(f'Задача с ID {task_id} не найдена.')
\ No newline at end of file
+            # Сначала задачи записываются в архив: если процесс упадет до удаления,
+            # задача окажется в обоих местах, но не пропадет
+            self.archive.append(tasks)
+            for task in tasks:
+                if self.loaded:
+                    del self.task_map[task.task_id]
+                    self.unindex_task(task)
+                self.commit("delete", task)
+        return tasks
@@ -3,6 +3,10 @@ import pytest
 import json
 from task_manager import TaskManager
 from task import Task
+import storage
+from storage import SqliteStorage
+from query import Query
+from search_index import SearchIndex
 from unittest.mock import patch
 
 @pytest.fixture
@@ -19,8 +23,9 @@ def test_add_task(task_manager):
     
 @patch('builtins.input', side_effect = [1,'Новый заголовок'])
 def test_edit_task_title(mock_input, task_manager):
+    import main
     task_manager.add_task('Заголовок','Описание', 'Категория', '2020-11-21','Низкий', 'не выполнено')
-    task_manager.edit_task(1)
+    main.main(['edit', '-id', '1'], manager=task_manager)
     TaskManager.input = lambda: '1'
     TaskManager.input = lambda: 'Новый заголовок'
     assert task_manager.tasks[0].title == 'Новый заголовок'
@@ -34,15 +39,656 @@ def test_del_task(task_manager):
 def test_list_tasks(capfd, task_manager):
     task_manager.add_task('Заголовок','Описание', 'Категория', '2020-11-21','Низкий', 'не выполнено')
     task_manager.add_task('Заголовок','Описание', 'Категория', '2020-11-21','Низкий', 'не выполнено')
-    task_manager.list_tasks()
+    import main
+    main.main(['list'], manager=task_manager)
     captured = capfd.readouterr()
     assert '2   заголовок   описание   категория        2020-11-21      низкий   не выполнено' in captured.out
     
 def test_list_tasks_by_id(capfd, task_manager):
     task_manager.add_task('Заголовок','Описание', 'Категория', '2020-11-21','Низкий', 'не выполнено')
     task_manager.add_task('Заголовок','Описание', 'Категория', '2020-11-21','Низкий', 'не выполнено')
-    task_manager.get_task_by_id(2)
+    import main
+    main.main(['list', '-id', '2'], manager=task_manager)
     captured = capfd.readouterr()
     assert '2   заголовок   описание   категория        2020-11-21      низкий   не выполнено' in captured.out
     
-    
\ No newline at end of file
+    
+
+def test_journal_replay(tmpdir):
+    filename = str(tmpdir.join('tasks.json'))
+    manager = TaskManager(filename=filename, journal=True)
+    manager.add_task('Заголовок','Описание', 'Категория', '2020-11-21','Низкий', 'не выполнено')
+    manager.add_task('Второй','Описание', 'Категория', '2020-11-21','Низкий', 'не выполнено')
+    manager.complete_task_by_id(1)
+    manager.delete_task(2)
+    with open(filename, encoding='utf-8') as file:
+        assert json.load(file) == []
+    reloaded = TaskManager(filename=filename, journal=True)
+    assert len(reloaded.tasks) == 1
+    assert reloaded.tasks[0].status == 'выполнено'
+
+
+def test_journal_compaction(tmpdir):
+    filename = str(tmpdir.join('tasks.json'))
+    manager = TaskManager(filename=filename, journal=True, journal_limit=1)
+    manager.add_task('Заголовок','Описание', 'Категория', '2020-11-21','Низкий', 'не выполнено')
+    assert not os.path.exists(manager.storage.journal_filename)
+    assert storage.JsonStorage(filename, cache=False).load()[0].title == 'заголовок'
+
+
+def test_sqlite_storage(capfd, tmpdir):
+    source = str(tmpdir.join('tasks.json'))
+    legacy = TaskManager(filename=source)
+    legacy.add_task('Заголовок','Описание', 'работа', '2020-11-21','Низкий', 'не выполнено')
+    manager = TaskManager(storage=SqliteStorage(str(tmpdir.join('tasks.db')), source=source))
+    assert manager.tasks == []
+    manager.add_task('Второй','Описание', 'дом', '2020-11-21','Низкий', 'не выполнено')
+    manager.complete_task_by_id(2)
+    assert manager.storage.get(2).status == 'выполнено'
+    assert [task.task_id for task in manager.storage.by_category('работа')] == [1]
+    manager.delete_task(1)
+    manager.add_task('Третий','Описание', 'дом', '2020-11-21','Низкий', 'не выполнено')
+    assert [task.task_id for task in manager.storage.load()] == [2, 3]
+    # Дата выполнения хранится в базе, поэтому архив считает срок от нее, а не от старого дедлайна
+    from datetime import date
+    assert manager.storage.get(2).completed_at == date.today().isoformat()
+    assert manager.archive_tasks(30) == []
+    # В базу старого формата колонка добавляется при открытии
+    import sqlite3
+    old = str(tmpdir.join('old.db'))
+    connection = sqlite3.connect(old)
+    connection.execute('CREATE TABLE tasks (task_id INTEGER PRIMARY KEY, title TEXT NOT NULL, '
+                       'description TEXT NOT NULL DEFAULT \'\', category TEXT, due_date TEXT, priority TEXT, status TEXT)')
+    connection.execute("INSERT INTO tasks VALUES (1, 'старая', '', 'дом', '2020-11-21', 'низкий', 'выполнено')")
+    connection.commit()
+    connection.close()
+    assert SqliteStorage(old).get(1).completed_at is None
+
+
+def test_indexes_follow_mutations(task_manager):
+    task_manager.add_task('Первая','Описание', 'работа', '2020-11-21','Низкий', 'не выполнено')
+    task_manager.add_task('Вторая','Описание', 'дом', '2020-11-21','Высокий', 'не выполнено')
+    task_manager.complete_task_by_id(1)
+    assert task_manager.indexes['status'] == {'выполнено': {1}, 'не выполнено': {2}}
+    task_manager.delete_task(2)
+    assert 'дом' not in task_manager.indexes['category']
+    assert task_manager.find_task(1).title == 'первая'
+    assert task_manager.find_task(2) is None
+
+
+def test_streaming_lazy_reads(capfd, tmpdir):
+    filename = str(tmpdir.join('tasks.json'))
+    manager = TaskManager(filename=filename, journal=True)
+    for i in range(30):
+        manager.add_task(f'Задача {i}','Описание', 'работа' if i % 2 else 'дом', '2020-11-21','Низкий', 'не выполнено')
+    manager.save_tasks()
+    manager.delete_task(3)
+    manager.complete_task_by_id(5)
+    items = list(storage.iter_json_array(filename, chunk_size=16))
+    assert storage.is_header(items[0]) and [item[0] for item in items[1:]] == list(range(1, 31))
+    lazy = TaskManager(filename=filename, journal=True, lazy=True)
+    assert lazy.task_map == {}
+    assert lazy.find_task(3) is None
+    assert lazy.find_task(5).status == 'выполнено'
+    assert len(lazy.storage.by_category('дом')) == 14
+    assert lazy.task_map == {}
+
+
+def test_compact_task_round_trip():
+    data = {'task_id': 1, 'title': 'заголовок', 'description': '', 'category': 'работа',
+            'due_date': '2024-11-29', 'priority': 'высокий', 'status': 'в процессе'}
+    task = Task.from_dict(data)
+    assert task.to_dict() == data
+    assert not hasattr(task, '__dict__')
+    assert task.priority_code > Task(2, 'x', priority='низкий').priority_code
+    task.due_date = '2024-12-01'
+    assert task.due_ordinal - Task.from_dict(data).due_ordinal == 2
+
+
+def test_snapshot_cache(tmpdir):
+    filename = str(tmpdir.join('tasks.json'))
+    manager = TaskManager(filename=filename)
+    manager.add_task('Заголовок','Описание', 'работа', '2020-11-21','Высокий', 'не выполнено')
+    # Полная перезапись не перечитывает файл ради хеша, а кеш после нее остается действительным
+    import cache
+    with patch.object(cache, 'file_digest', side_effect=AssertionError):
+        manager.save_tasks()
+    cached = manager.storage.cache.load()
+    assert [task.to_dict() for task in cached] == [task.to_dict() for task in manager.tasks]
+    # После touch хеш совпадает, отметка в кеше обновляется и следующий запуск хеш не считает
+    os.utime(filename, ns=(0, 0))
+    assert manager.storage.cache.load() is not None
+    with patch.object(cache, 'stream_digest', side_effect=AssertionError):
+        assert manager.storage.cache.load() is not None
+    with open(filename, 'w', encoding='utf-8') as file:
+        json.dump([], file)
+    assert manager.storage.cache.load() is None
+    assert TaskManager(filename=filename).tasks == []
+
+
+def test_server_forwarding(tmpdir, task_manager):
+    import asyncio
+    import threading
+    import time
+    import client
+    import server
+
+    path = str(tmpdir.join('tasks.sock'))
+
+    def handle(argv):
+        task = task_manager.add_task(argv[0], '', 'работа', '2020-11-21', 'низкий', 'не выполнено')
+        print(f'Задача "{task.title}" успешно создана')
+        return True
+
+    thread = threading.Thread(target=asyncio.run, args=(server.run_server(handle, path),), daemon=True)
+    thread.start()
+    for _ in range(50):
+        if client.is_running(path):
+            break
+        time.sleep(0.05)
+    assert client.forward(['Через сервер'], path) == 'Задача "через сервер" успешно создана\n'
+    assert task_manager.tasks[0].title == 'через сервер'
+    assert client.forward(['--help'], str(tmpdir.join('missing.sock'))) is None
+    # Сервер не выполняет команды с другими флагами хранилища
+    import main
+    parser = main.build_parser()
+    served = main.storage_options(parser.parse_args(['serve']))
+    assert main.storage_options(parser.parse_args(['list'])) == served
+    assert main.storage_options(parser.parse_args(['--compress', 'list'])) != served
+    assert main.storage_options(parser.parse_args(['--shard-by', 'month', 'list'])) != served
+
+
+def test_concurrent_adds_do_not_lose_updates(tmpdir):
+    import subprocess
+    import sys
+
+    filename = str(tmpdir.join('tasks.json'))
+    script = (
+        'import sys; sys.path.insert(0, sys.argv[1]); from task_manager import TaskManager\n'
+        'for i in range(10):\n'
+        '    TaskManager(filename=sys.argv[2]).add_task("t", "", "дом", "2020-11-21", "низкий", "не выполнено")\n'
+    )
+    root = os.path.dirname(os.path.abspath(__file__))
+    processes = [subprocess.Popen([sys.executable, '-c', script, root, filename], stdout=subprocess.DEVNULL) for _ in range(4)]
+    for process in processes:
+        assert process.wait() == 0
+    ids = [task.task_id for task in TaskManager(filename=filename).tasks]
+    assert sorted(ids) == list(range(1, 41))
+
+
+def test_concurrent_adds_on_sqlite(tmpdir):
+    import subprocess
+    import sys
+
+    filename = str(tmpdir.join('tasks.db'))
+    script = (
+        'import sys; sys.path.insert(0, sys.argv[1]); from task_manager import TaskManager\n'
+        'from storage import SqliteStorage\n'
+        'manager = TaskManager(storage=SqliteStorage(sys.argv[2]))\n'
+        'for i in range(30):\n'
+        '    manager.add_task("t", "", "дом", "2020-11-21", "низкий", "не выполнено")\n'
+    )
+    root = os.path.dirname(os.path.abspath(__file__))
+    processes = [subprocess.Popen([sys.executable, '-c', script, root, filename], stdout=subprocess.DEVNULL) for _ in range(4)]
+    for process in processes:
+        assert process.wait() == 0
+    assert [task.task_id for task in SqliteStorage(filename).load()] == list(range(1, 121))
+
+
+def test_open_batch_keeps_changes_of_other_processes(tmpdir):
+    filename = str(tmpdir.join('tasks.json'))
+    TaskManager(filename=filename).add_task('Исходная','', 'дом', '2020-11-21','Низкий', 'не выполнено')
+    # Сервер держит пачку открытой между командами
+    served = TaskManager(filename=filename)
+    served.begin_batch()
+    served.add_task('Через сервер','', 'дом', '2020-11-21','Низкий', 'не выполнено')
+    local = TaskManager(filename=filename)
+    local.edit_task(1, lambda task: setattr(task, 'title', 'изменена') or task)
+    local.add_task('Локальная','', 'дом', '2020-11-21','Низкий', 'не выполнено')
+    served.flush()
+    tasks = {task.task_id: task.title for task in TaskManager(filename=filename).tasks}
+    assert tasks == {1: 'изменена', 2: 'локальная', 3: 'через сервер'}
+
+    # Пока edit спрашивает пользователя, другой процесс меняет другое поле задачи
+    def ask(task):
+        TaskManager(filename=filename).complete_task_by_id(1)
+        task.priority = 'высокий'
+        return task
+
+    assert local.edit_task(1, ask).priority == 'высокий'
+    task = TaskManager(filename=filename).get_task_by_id(1)
+    assert (task.title, task.priority, task.status) == ('изменена', 'высокий', 'выполнено')
+
+    # Ленивые хранилища не перечитываются целиком, но айди новой задачи все равно не затирает чужую
+    for lazy_storage in (SqliteStorage, storage.RecordStorage):
+        path = str(tmpdir.join(f'lazy.{lazy_storage.__name__}'))
+        served = TaskManager(storage=lazy_storage(path))
+        served.begin_batch()
+        served.add_task('Через сервер','', 'дом', '2020-11-21','Низкий', 'не выполнено')
+        TaskManager(storage=lazy_storage(path)).add_task('Локальная','', 'дом', '2020-11-21','Низкий', 'не выполнено')
+        served.flush()
+        tasks = [(task.task_id, task.title) for task in lazy_storage(path).load()]
+        assert tasks == [(1, 'локальная'), (2, 'через сервер')]
+
+
+def test_batch_commits_once(tmpdir):
+    filename = str(tmpdir.join('tasks.json'))
+    manager = TaskManager(filename=filename, journal=True)
+    with manager.batch():
+        for i in range(3):
+            manager.add_task(f'Задача {i}','', 'дом', '2020-11-21','Низкий', 'не выполнено')
+        assert manager.pending and not os.path.exists(manager.storage.journal_filename)
+    with open(manager.storage.journal_filename, encoding='utf-8') as file:
+        assert len(file.readlines()) == 3
+    manager.delete_task(2)
+    manager.add_task('Новая','', 'дом', '2020-11-21','Низкий', 'не выполнено')
+    assert [task.task_id for task in TaskManager(filename=filename, journal=True).tasks] == [1, 3, 4]
+
+
+def test_query_uses_most_selective_index(task_manager):
+    for i in range(10):
+        task_manager.add_task(f'Задача {i}','', 'работа' if i < 8 else 'дом', f'2020-11-{i + 10}', 'высокий' if i % 2 else 'низкий', 'не выполнено')
+    query = Query(category=['работа'], priority=['высокий'], due_from='2020-11-12', sort=['-due_date'], limit=2)
+    assert [task.task_id for task in task_manager.query(query)] == [8, 6]
+    assert query.plan == 'priority'
+    query = Query(category=['дом'], status=['не выполнено'])
+    assert [task.task_id for task in task_manager.query(query)] == [9, 10]
+    assert query.plan == 'category'
+    assert [task.task_id for task in task_manager.query(sort=['-priority', 'id'], offset=4, limit=2)] == [10, 1]
+
+
+def test_deadline_index(task_manager):
+    from datetime import date
+    for day in (25, 21, 23, 27):
+        task_manager.add_task('Задача','', 'дом', f'2020-11-{day}', 'низкий', 'не выполнено')
+    today = date(2020, 11, 23)
+    assert [task.task_id for task in task_manager.overdue_tasks(today)] == [2]
+    assert [task.task_id for task in task_manager.upcoming_tasks(2, today)] == [3, 1]
+    task_manager.complete_task_by_id(3)
+    task_manager.delete_task(1)
+    assert task_manager.upcoming_tasks(2, today) == []
+    assert task_manager.deadlines == [(date(2020, 11, 21).toordinal(), 2), (date(2020, 11, 27).toordinal(), 4)]
+    query = Query(status=['не выполнено'], due_from='2020-11-26')
+    assert [task.task_id for task in task_manager.query(query)] == [4]
+    assert query.plan == 'due_date'
+
+
+@patch('builtins.input', side_effect=[1, 'Полить цветы'])
+def test_search_index(mock_input, tmpdir):
+    filename = str(tmpdir.join('tasks.json'))
+    manager = TaskManager(filename=filename)
+    manager.add_task('Купить молоко','молоко и хлеб, много молока', 'дом', '2020-11-21','Низкий', 'не выполнено')
+    manager.add_task('Купить хлеб','', 'дом', '2020-11-21','Низкий', 'не выполнено')
+    manager.add_task('Отчет','написать отчет', 'работа', '2020-11-21','Низкий', 'не выполнено')
+    assert [task.task_id for task in manager.search('молок')] == [1]
+    assert [task.task_id for task in manager.search('куп хлеб')] == [1, 2]
+    assert os.path.exists(manager.search_filename)
+    other = TaskManager(filename=filename)
+    other.search('молок')
+    saved = os.stat(manager.search_filename).st_mtime_ns
+    import main
+    main.main(['edit', '-id', '3'], manager=other)
+    other.delete_task(2)
+    # Изменения обновляют индекс в памяти и дописываются в журнал, сам индекс на диске не переписывается
+    assert os.stat(manager.search_filename).st_mtime_ns == saved
+    assert os.path.exists(SearchIndex(manager.search_filename).log_filename)
+    assert [task.task_id for task in other.search('цвет')] == [3]
+    reloaded = TaskManager(filename=filename)
+    search_index = SearchIndex(reloaded.search_filename)
+    assert search_index.load(reloaded.stamp)
+    # Другой процесс применяет журнал к индексу с диска, а не строит индекс заново
+    with patch.object(SearchIndex, 'build', side_effect=AssertionError('перестроение')):
+        assert [task.task_id for task in reloaded.search('купить')] == [1]
+        assert reloaded.search('хлеб') == [reloaded.find_task(1)]
+        assert [task.task_id for task in reloaded.search('цвет')] == [3]
+    # Длинный журнал сворачивается в индекс при поиске
+    with patch('search_index.COMPACT_RATIO', 10 ** 6):
+        TaskManager(filename=filename).search('хлеб')
+    assert not os.path.exists(search_index.log_filename)
+
+    records = storage.RecordStorage(str(tmpdir.join('tasks.records')), source=filename)
+    lazy = TaskManager(storage=records)
+    assert [task.task_id for task in lazy.search('отчет')] == [3]
+    assert SearchIndex(lazy.search_filename).load(records.stamp())
+    # Изменение на ленивом хранилище не читает все задачи ради индекса поиска
+    with patch.object(records, 'iter_tasks', side_effect=AssertionError('полный обход')):
+        lazy.complete_task_by_id(1)
+    assert lazy.search('молоко')[0].status == 'выполнено'
+
+
+def test_import_export(tmpdir, task_manager):
+    import transfer
+    source = tmpdir.join('import.csv')
+    source.write_text(
+        'title,description,category,due_date,priority,status\n'
+        'Первая,,работа,2020-11-21,высокий,\n'
+        ',без названия,дом,2020-11-21,низкий,не выполнено\n'
+        'Вторая,,космос,2020-11-21,низкий,не выполнено\n'
+        'Третья,описание,дом,,средний,в процессе\n',
+        encoding='utf-8',
+    )
+    report = transfer.import_tasks(task_manager, str(source))
+    assert report.imported == 2
+    assert [line for line, _ in report.errors] == [3, 4]
+    assert [task.title for task in task_manager.tasks] == ['первая', 'третья']
+    target = str(tmpdir.join('export.jsonl'))
+    assert transfer.export_tasks(task_manager, target) == 2
+    second = TaskManager(filename=str(tmpdir.join('second.json')))
+    assert transfer.import_tasks(second, target).imported == 2
+    assert [task.to_dict() for task in second.tasks] == [task.to_dict() for task in task_manager.tasks]
+    # Выполненная задача выгружается в CSV вместе с датой выполнения и читается обратно
+    task_manager.complete_task_by_id(1)
+    task_manager.find_task(1).completed_at = '2020-01-01'
+    target = str(tmpdir.join('export.csv'))
+    assert transfer.export_tasks(task_manager, target) == 2
+    third = TaskManager(filename=str(tmpdir.join('third.json')))
+    assert transfer.import_tasks(third, target).imported == 2
+    assert [task.completed_at for task in third.tasks] == ['2020-01-01', None]
+
+
+def test_import_reports_bad_rows_and_failed_batch_is_not_saved(tmpdir, task_manager):
+    import transfer
+    source = tmpdir.join('import.jsonl')
+    source.write_text(
+        '{"title": 5}\n'
+        '{"title": "Первая", "due_date": 20201121}\n'
+        '{"task_id": 7, "title": "Вторая", "category": "дом"}\n',
+        encoding='utf-8',
+    )
+    report = transfer.import_tasks(task_manager, str(source))
+    assert report.imported == 1 and [line for line, _ in report.errors] == [1, 2]
+
+    with pytest.raises(RuntimeError):
+        with task_manager.batch():
+            task_manager.add_task('Не сохранится','', 'дом', '2020-11-21','Низкий', 'не выполнено')
+            raise RuntimeError
+    assert [task.title for task in task_manager.tasks] == ['вторая']
+    assert [task.title for task in TaskManager(filename=task_manager.filename).tasks] == ['вторая']
+
+    # В открытой пачке сервера ошибка отменяет только изменения своего batch
+    task_manager.begin_batch()
+    task_manager.add_task('Раньше','', 'дом', '2020-11-21','Низкий', 'не выполнено')
+    source.write_binary(b'{"title": "\xd0\x9f\xd0\xb5"}\n' * 2000 + b'{"title": "\xff"}\n')
+    with pytest.raises(UnicodeDecodeError):
+        transfer.import_tasks(task_manager, str(source))
+    task_manager.flush()
+    task_manager.pending = None
+    assert [task.title for task in task_manager.tasks] == ['вторая', 'раньше']
+    assert [task.title for task in TaskManager(filename=task_manager.filename).tasks] == ['вторая', 'раньше']
+
+
+def test_complete_rule_is_the_same_for_one_and_many(capfd, task_manager):
+    import main
+    for status in ('в процессе', 'в процессе', 'выполнено'):
+        task_manager.add_task('Задача','', 'дом', '2020-11-21','Низкий', status)
+    main.main(['complete', '-id', '1'], manager=task_manager)
+    main.main(['complete', '-id', '2,3'], manager=task_manager)
+    main.main(['complete', '-id', '3'], manager=task_manager)
+    assert [task.status for task in task_manager.tasks] == ['выполнено'] * 3
+    out = capfd.readouterr().out
+    assert out.count('низкий   выполнено\n') == 2 and out.endswith('Задача уже выполнена.\n')
+    assert task_manager.complete_task_by_id(3) is None
+
+
+def test_batch_mutations(capfd, task_manager):
+    import main
+    import utils
+    from query import parse_where
+    assert utils.parse_ids('1,3-5') == [1, 3, 4, 5]
+    for i in range(6):
+        task_manager.add_task(f'Задача {i}','', 'работа' if i < 4 else 'дом', f'2020-11-{i + 20}', 'низкий', 'не выполнено')
+    tasks, missing = task_manager.complete_tasks([1, 2, 9])
+    assert [task.task_id for task in tasks] == [1, 2] and missing == [9]
+    query = parse_where('category=работа,status=не выполнено')
+    tasks, _ = task_manager.edit_tasks({'priority': 'высокий'}, query=query)
+    assert [task.task_id for task in tasks] == [3, 4]
+    assert task_manager.indexes['priority']['высокий'] == {3, 4}
+    main.main(['del', '-w', 'due>=2020-11-24,category=дом'], manager=task_manager)
+    assert 'Удалено задач: 2' in capfd.readouterr().out
+    assert [task.task_id for task in task_manager.tasks] == [1, 2, 3, 4]
+    # Категория при пакетном изменении проверяется так же, как у add и import
+    assert utils.validate_edit_fields({'category': 'космос'}).startswith('Категория')
+    with pytest.raises(SystemExit):
+        main.main(['edit', '-id', '1', '-c', 'космос'], manager=task_manager)
+    assert task_manager.find_task(1).category == 'работа'
+    with pytest.raises(ValueError):
+        parse_where('color=red')
+
+
+def test_profile_hooks(capfd, tmpdir, monkeypatch):
+    import main
+    filename = str(tmpdir.join('tasks.json'))
+    TaskManager(filename=filename).add_task('Задача','', 'дом', '2020-11-21','Низкий', 'не выполнено')
+    phases = []
+    manager = TaskManager(storage=storage.JsonStorage(filename, cache=False), hooks=[lambda name, *_: phases.append(name)])
+    assert phases == ['read', 'parse', 'construct', 'load', 'index']
+    manager.complete_task_by_id(1)
+    assert phases[5:] == ['serialize', 'write', 'save']
+    metrics_file = tmpdir.join('metrics.jsonl')
+    main.main(['--profile', str(metrics_file), 'list', '-c', 'дом'], manager=manager)
+    main.main(['--profile', str(metrics_file), '--profile-memory', 'list', '-c', 'дом'], manager=manager)
+    timing, memory = map(json.loads, metrics_file.read_text(encoding='utf-8').splitlines())
+    assert {'argparse', 'query', 'render'} <= set(timing['phases'])
+    assert timing['peak_bytes'] is None and timing['phases']['query']['allocated'] is None
+    assert memory['peak_bytes'] > 0 and memory['phases']['query']['allocated'] is not None
+    # --profile без файла перед командой пишет в metrics.jsonl текущей папки
+    monkeypatch.chdir(tmpdir)
+    main.main(['--profile', 'list', '-c', 'дом'], manager=manager)
+    assert len(metrics_file.read_text(encoding='utf-8').splitlines()) == 3
+    assert 'query:' in capfd.readouterr().err
+    # Ленивые команды чтения тоже разбиты на фазы: поиск по айди и чтение потока задач
+    lazy_file = tmpdir.join('lazy.jsonl')
+    for argv in (['list', '-id', '1'], ['list']):
+        lazy = TaskManager(storage=storage.JsonStorage(filename, cache=False), lazy=True)
+        main.main(['--profile', str(lazy_file)] + argv, manager=lazy)
+    by_id, listing = map(json.loads, lazy_file.read_text(encoding='utf-8').splitlines())
+    assert 'query' in by_id['phases']
+    assert {'load', 'render'} <= set(listing['phases'])
+    assert listing['phases']['load']['seconds'] <= listing['phases']['render']['seconds']
+
+
+def test_record_storage(tmpdir):
+    records = storage.RecordStorage(str(tmpdir.join('tasks.records')))
+    manager = TaskManager(filename=str(tmpdir.join('tasks.json')), storage=records)
+    for i in range(3):
+        manager.add_task(f'Задача {i}','', 'дом', '2020-11-21','Низкий', 'не выполнено')
+    size = os.path.getsize(records.filename)
+    manager.complete_task_by_id(2)
+    assert os.path.getsize(records.filename) == size
+    assert records.get(2).status == 'выполнено'
+    manager.delete_task(3)
+    manager.add_task('Новая','', 'дом', '2020-11-21','Низкий', 'не выполнено')
+    assert [task.task_id for task in records.iter_tasks()] == [1, 2, 4]
+    assert records.get(3) is None and records.next_id() == 5
+
+
+def test_sharded_storage(tmpdir):
+    sharded = storage.ShardedStorage(str(tmpdir.join('tasks.shards')), workers=2)
+    sharded.PARALLEL_BYTES = 0
+    manager = TaskManager(filename=str(tmpdir.join('tasks.json')), storage=sharded)
+    for i, category in enumerate(['работа', 'дом', 'работа', 'учеба']):
+        manager.add_task(f'Задача {i}','', category, '2020-11-21','Низкий', 'не выполнено')
+    work = sharded.shard_filename('работа')
+    home = sharded.shard_filename('дом')
+    home_mtime = os.stat(home).st_mtime_ns
+    manager.complete_task_by_id(3)
+    assert os.stat(home).st_mtime_ns == home_mtime
+    query = Query(category=['работа'])
+    assert [task.task_id for task in TaskManager(storage=sharded, lazy=True).query(query)] == [1, 3]
+    assert query.plan == 'shards:1/3'
+    manager.edit_tasks({'category': 'дом'}, [1])
+    manager.delete_task(4)
+    assert sorted(sharded.manifest['shards']) == ['дом', 'работа']
+    assert [(task.task_id, task.category) for task in TaskManager(storage=sharded).tasks] == [(1, 'дом'), (2, 'дом'), (3, 'работа')]
+    assert len(storage.JsonStorage(work, cache=False).load()) == 1
+    # Полный list идет через iter_tasks и при больших шардах тоже загружает их в пуле процессов
+    with patch.object(storage, 'ProcessPoolExecutor', wraps=storage.ProcessPoolExecutor) as pool:
+        assert [task.task_id for task in TaskManager(storage=sharded, lazy=True).list_tasks()] == [1, 2, 3]
+    assert pool.called
+
+
+def test_archive(capfd, tmpdir):
+    from datetime import date
+    import main
+    filename = str(tmpdir.join('tasks.json'))
+    manager = TaskManager(filename=filename)
+    for i in range(3):
+        manager.add_task(f'Задача {i}','', 'дом', '2020-11-21','Низкий', 'не выполнено')
+    manager.complete_task_by_id(1)
+    manager.complete_task_by_id(3)
+    manager.find_task(1).completed_at = '2020-01-01'
+    manager.save_tasks()
+    assert manager.find_task(3).completed_at == date.today().isoformat()
+    assert [task.task_id for task in manager.archive_tasks(days=30)] == [1]
+    reloaded = TaskManager(filename=filename)
+    assert [task.task_id for task in reloaded.tasks] == [2, 3]
+    assert [task.task_id for task in reloaded.query(status=['выполнено'], include_archived=True)] == [1, 3]
+    capfd.readouterr()
+    main.main(['list', '-id', '1', '-a'], manager=reloaded)
+    assert 'задача 0' in capfd.readouterr().out
+    assert [task.task_id for task in reloaded.archive_tasks(days=0)] == [3]
+    reloaded = TaskManager(filename=filename)
+    reloaded.add_task('Новая','', 'дом', '2020-11-21','Низкий', 'не выполнено')
+    assert [task.task_id for task in reloaded.tasks] == [2, 4]
+
+
+def test_streaming_render(capfd, task_manager):
+    import io
+    import main
+    import render
+    import utils
+    for i in range(5):
+        task_manager.add_task(f'Задача {i}','', 'дом', '2020-11-21','Низкий', 'не выполнено')
+    capfd.readouterr()
+    utils.pretty_print([render.HEADER] + [render.task_cells(task) for task in task_manager.tasks])
+    expected = capfd.readouterr().out
+    out = io.StringIO()
+    assert render.render_tasks(iter(task_manager.tasks), out=out) == 5
+    assert out.getvalue() == expected
+    task_manager.edit_tasks({'title': 'очень длинное название'}, [5])
+    out = io.StringIO()
+    render.render_tasks(task_manager.tasks, out=out, sample_size=2)
+    assert out.getvalue().splitlines()[1] == expected.splitlines()[1]
+    main.main(['list', '--page', '2', '--limit', '2'], manager=task_manager)
+    output = capfd.readouterr().out
+    assert 'задача 2' in output and 'задача 1' not in output and '--after 4' in output
+    main.main(['list', '--after', '4', '-f', 'jsonl'], manager=task_manager)
+    assert [json.loads(line)['task_id'] for line in capfd.readouterr().out.splitlines()] == [5]
+    # Сортировка по убыванию, как в справке и readme
+    main.main(['list', '--sort=-id', '--limit', '2', '-f', 'jsonl'], manager=task_manager)
+    assert [json.loads(line)['task_id'] for line in capfd.readouterr().out.splitlines()] == [5, 4]
+    main.main(['list', '-c', 'дом', '--limit', '1', '-f', 'csv'], manager=task_manager)
+    assert capfd.readouterr().out.splitlines() == ['task_id,title,description,category,due_date,priority,status', '1,задача 0,,дом,2020-11-21,низкий,не выполнено']
+    # Отрицательные лимиты и смещения отклоняются при разборе аргументов, а не падают в islice
+    for argv, message in (
+        (['list', '--offset', '-1'], 'не может быть отрицательным'),
+        (['list', '--limit', '-1'], 'не может быть отрицательным'),
+        (['changes', '--limit', '-1'], 'не может быть отрицательным'),
+        (['list', '--page', '0'], 'должно быть больше нуля'),
+    ):
+        with pytest.raises(SystemExit):
+            main.main(argv, manager=task_manager)
+        assert message in capfd.readouterr().err
+
+
+def test_data_api_and_async_manager(capfd, tmpdir):
+    import asyncio
+    from async_manager import AsyncTaskManager
+    filename = str(tmpdir.join('tasks.json'))
+    manager = TaskManager(filename=filename)
+    task = manager.add_task('Первая','', 'дом', '2020-11-21','Низкий', 'не выполнено')
+    assert manager.get_task_by_id(task.task_id) is task
+    assert manager.complete_task_by_id(1) is task and manager.complete_task_by_id(1) is None
+    assert manager.delete_task(99) is None
+    assert capfd.readouterr().out == ''
+
+    async def scenario():
+        tasks = await AsyncTaskManager.open(filename=filename)
+        await tasks.create_task(title='Вторая', category='работа')
+        await tasks.create_task(title='Третья', category='работа')
+        listed = [task.task_id async for task in tasks.list_tasks(chunk_size=2)]
+        by_category = await tasks.get_tasks_by_category('работа')
+        deleted = await tasks.delete_task(2)
+        await tasks.close()
+        return listed, [task.task_id for task in by_category], deleted.title
+
+    assert asyncio.run(scenario()) == ([1, 2, 3], [2, 3], 'вторая')
+    assert [task.task_id for task in TaskManager(filename=filename).list_tasks()] == [1, 3]
+
+    async def change_while_listing():
+        tasks = await AsyncTaskManager.open(filename=filename)
+        listed = []
+        async for task in tasks.list_tasks(chunk_size=1):
+            listed.append(task.task_id)
+            await tasks.create_task(title='Новая', category='работа')
+        await tasks.close()
+        return listed
+
+    assert asyncio.run(change_while_listing()) == [1, 3]
+
+    # Соединение SQLite создается в потоке вызывающего, а используется в потоке менеджера
+    async def on_sqlite():
+        path = str(tmpdir.join('tasks.db'))
+        wrapped = AsyncTaskManager(TaskManager(storage=SqliteStorage(path)))
+        opened = await AsyncTaskManager.open(storage=SqliteStorage(path))
+        await wrapped.create_task(title='В базе', category='работа')
+        task = await opened.get_task_by_id(1)
+        await wrapped.close()
+        await opened.close()
+        return task.title
+
+    assert asyncio.run(on_sqlite()) == 'в базе'
+    manager = TaskManager(filename=filename)
+    for task in manager.list_tasks():
+        manager.delete_task(task.task_id + 1)
+    assert [task.task_id for task in manager.list_tasks()] == [1, 3, 5]
+
+
+def test_change_feed_and_replica(tmpdir):
+    from changes import ChangeFeed, Replica
+    feed = ChangeFeed(str(tmpdir.join('feed.changes')))
+    for task_id in range(1, 301):
+        feed.append([('add', Task(task_id, f'задача {task_id}'))])
+    assert feed.last_seq() == 300 and feed.first_seq() == 1
+    for seq in (0, 1, 150, 299, 300):
+        assert [record['seq'] for record in feed.since(seq)] == list(range(seq + 1, 301))
+
+    manager = TaskManager(filename=str(tmpdir.join('tasks.json')))
+    manager.add_task('Первая','', 'дом', '2020-11-21','Низкий', 'не выполнено')
+    replica = Replica(str(tmpdir.join('replica.records')))
+    assert manager.replicate(replica) == 1 and replica.seq() == 1
+    manager.add_task('Вторая','', 'дом', '2020-11-21','Низкий', 'не выполнено')
+    manager.complete_task_by_id(1)
+    manager.delete_task(2)
+    assert [record['op'] for record in manager.changes_since(1)] == ['add', 'update', 'delete']
+    assert manager.replicate(replica) == 3 and replica.seq() == 4
+    assert [task.to_dict() for task in replica.storage.iter_tasks()] == [manager.get_task_by_id(1).to_dict()]
+
+
+def test_change_feed_location_trimming_and_rollback(tmpdir):
+    from changes import ChangeFeed, Replica
+    manager = TaskManager(storage=storage.RecordStorage(str(tmpdir.join('other.records'))))
+    assert manager.changes.filename == str(tmpdir.join('other.records.changes'))
+    # У хранилищ с одним именем, но разного типа свои ленты и архивы
+    other = TaskManager(storage=SqliteStorage(str(tmpdir.join('other.db'))))
+    assert other.changes.filename == str(tmpdir.join('other.db.changes'))
+    assert other.archive.max_id_filename == str(tmpdir.join('other.db.archive.id'))
+    # Служебные файлы Json хранилища старой версии переименовываются
+    tmpdir.join('legacy.changes').write('')
+    legacy = TaskManager(filename=str(tmpdir.join('legacy.json')))
+    assert legacy.changes.filename == str(tmpdir.join('legacy.json.changes')) and os.path.exists(legacy.changes.filename)
+    manager.changes.limit = 2000
+    for i in range(30):
+        manager.add_task(f'Задача {i}','', 'дом', '2020-11-21','Низкий', 'не выполнено')
+    assert os.path.getsize(manager.changes.filename) <= 2000
+    assert manager.changes.last_seq() == 30 and manager.changes.first_seq() > 1
+    # Реплика отстала дальше начала ленты - делается полная копия
+    replica = Replica(str(tmpdir.join('replica.records')))
+    replica.set_seq(0)
+    assert manager.replicate(replica) == 30 and replica.seq() == 30
+
+    feed = ChangeFeed(str(tmpdir.join('feed.changes')))
+    with pytest.raises(OSError):
+        with feed.record([('add', Task(1, 'первая'))]):
+            raise OSError('диск заполнен')
+    assert feed.last_seq() == 0
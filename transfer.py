@@ -0,0 +1,160 @@
+import os
+import csv
+import json
+import time
+from typing import Iterator
+from task_manager import TaskManager
+import utils
+
+
+FORMATS = ["jsonl", "csv"]
+FIELDS = ["task_id", "title", "description", "category", "due_date", "priority", "status", "completed_at"]
+
+
+class ImportReport:
+    """Итог импорта: сколько задач добавлено, ошибки по строкам и скорость"""
+
+    def __init__(self):
+        self.imported = 0
+        self.errors: list[tuple[int, str]] = []
+        self.seconds = 0.0
+
+    @property
+    def rate(self) -> float:
+        """Задач в секунду"""
+        return self.imported / self.seconds if self.seconds else 0.0
+
+
+def detect_format(path: str, file_format: str | None) -> str:
+    """Формат файла: явно указанный или по расширению
+
+    Args:
+        path (str): Путь до файла
+        file_format (str | None): Явно указанный формат
+
+    Returns:
+        str: jsonl или csv
+    """
+    if file_format:
+        return file_format
+    return "csv" if os.path.splitext(path)[1].lower() == ".csv" else "jsonl"
+
+
+def read_records(path: str, file_format: str) -> Iterator[tuple[int, dict | None, str | None]]:
+    """Потоковое чтение записей файла по одной
+
+    Args:
+        path (str): Путь до файла
+        file_format (str): jsonl или csv
+
+    Yields:
+        tuple[int, dict | None, str | None]: Номер строки, запись и ошибка разбора
+    """
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        if file_format == "csv":
+            reader = csv.DictReader(file)
+            for record in reader:
+                yield reader.line_num, record, None
+            return
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as error:
+                yield line_number, None, f"некорректный Json: {error.msg}"
+                continue
+            if not isinstance(record, dict):
+                yield line_number, None, "запись должна быть объектом"
+                continue
+            yield line_number, record, None
+
+
+def check_types(record: dict) -> str | None:
+    """Проверка, что поля задачи в записи - строки. Айди не проверяется, он все равно не используется
+
+    Args:
+        record (dict): Запись из файла
+
+    Returns:
+        str | None: Текст ошибки или None
+    """
+    for field in FIELDS[1:]:
+        value = record.get(field)
+        if value is not None and not isinstance(value, str):
+            return f'поле "{field}" должно быть строкой'
+    return None
+
+
+def import_tasks(manager: TaskManager, path: str, file_format: str | None = None) -> ImportReport:
+    """Импорт задач одной пачкой - хранилище перезаписывается один раз на весь файл.
+
+    Задачи получают новые айди, айди из файла игнорируются. Дата выполнения
+    из файла сохраняется у выполненных задач. Записи с ошибками пропускаются,
+    остальные импортируются.
+
+    Args:
+        manager (TaskManager): Менеджер задач
+        path (str): Путь до файла
+        file_format (str | None): jsonl или csv. По умолчанию - по расширению
+
+    Returns:
+        ImportReport: Итог импорта
+    """
+    report = ImportReport()
+    started = time.perf_counter()
+    with manager.batch():
+        for line_number, record, error in read_records(path, detect_format(path, file_format)):
+            if record is not None:
+                error = check_types(record)
+                if not error:
+                    fields = {field: record.get(field) or None for field in FIELDS}
+                    error = utils.validate_task_fields(
+                        fields["title"], fields["category"], fields["due_date"], fields["priority"], fields["status"]
+                    )
+            if error:
+                report.errors.append((line_number, error))
+                continue
+            try:
+                manager.create_task(
+                    title=fields["title"],
+                    description=fields["description"] or "",
+                    category=fields["category"] or "личное",
+                    due_date=fields["due_date"],
+                    priority=fields["priority"] or "низкий",
+                    status=fields["status"] or "не выполнено",
+                    completed_at=fields["completed_at"],
+                )
+            except (ValueError, TypeError, AttributeError) as error:
+                report.errors.append((line_number, str(error)))
+                continue
+            report.imported += 1
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def export_tasks(manager: TaskManager, path: str, file_format: str | None = None) -> int:
+    """Потоковый экспорт задач в файл
+
+    Args:
+        manager (TaskManager): Менеджер задач
+        path (str): Путь до файла
+        file_format (str | None): jsonl или csv. По умолчанию - по расширению
+
+    Returns:
+        int: Количество выгруженных задач
+    """
+    file_format = detect_format(path, file_format)
+    tasks = manager.task_map.values() if manager.loaded else manager.storage.iter_tasks()
+    count = 0
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        if file_format == "csv":
+            writer = csv.DictWriter(file, fieldnames=FIELDS)
+            writer.writeheader()
+        for task in tasks:
+            if file_format == "csv":
+                writer.writerow(task.to_dict())
+            else:
+                file.write(json.dumps(task.to_dict(), ensure_ascii=False) + "\n")
+            count += 1
+    return count
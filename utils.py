@@ -1,5 +1,6 @@
-from task import Task
+from task import Task, CATEGORIES, PRIORITIES, STATUSES, date_to_ordinal
 from datetime import datetime
+import argparse
 
 def pretty_print(data):
     """Вывод информации в виде таблицы
@@ -17,6 +18,127 @@ def pretty_print(data):
         print(row_format.format(*row))
 
 
+def parse_ids(value: str) -> list[int]:
+    """Разбор списка айди вида 1,2,5-9
+
+    Args:
+        value (str): Айди через запятую, диапазоны через дефис
+
+    Returns:
+        list[int]: Айди задач
+
+    Raises:
+        ValueError: Если список записан неверно
+    """
+    ids = []
+    for part in filter(None, (part.strip() for part in value.split(","))):
+        if "-" in part:
+            first, last = (int(number) for number in part.split("-", 1))
+            ids.extend(range(first, last + 1))
+        else:
+            ids.append(int(part))
+    return ids
+
+
+def non_negative_int(value: str) -> int:
+    """Целое число не меньше нуля, тип аргумента argparse для лимитов и смещений
+
+    Args:
+        value (str): Значение аргумента
+
+    Returns:
+        int: Число
+
+    Raises:
+        argparse.ArgumentTypeError: Если значение не число или меньше нуля
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ожидалось целое число, получено {value!r}")
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"значение не может быть отрицательным: {number}")
+    return number
+
+
+def positive_int(value: str) -> int:
+    """Целое число больше нуля, тип аргумента argparse для номеров страниц
+
+    Args:
+        value (str): Значение аргумента
+
+    Returns:
+        int: Число
+
+    Raises:
+        argparse.ArgumentTypeError: Если значение не число или меньше единицы
+    """
+    number = non_negative_int(value)
+    if number == 0:
+        raise argparse.ArgumentTypeError("значение должно быть больше нуля")
+    return number
+
+
+def validate_edit_fields(fields: dict) -> str | None:
+    """Проверка новых значений полей при редактировании без вопросов пользователю
+
+    Args:
+        fields (dict): Новые значения: title, description, due_date, category, priority, status
+
+    Returns:
+        str | None: Текст ошибки или None, если все поля корректны
+    """
+    if "title" in fields and not fields["title"]:
+        return 'Название обязательно к заполнению.'
+    if fields.get("due_date"):
+        try:
+            date_to_ordinal(fields["due_date"])
+        except ValueError:
+            return 'Дата должна быть в формате год-месяц-день.'
+    if "category" in fields and fields["category"].lower() not in CATEGORIES:
+        return f'Категория должна быть одной из: {", ".join(CATEGORIES)}'
+    if "priority" in fields and fields["priority"].lower() not in PRIORITIES:
+        return "Сказано же - низкий, средний, высокий."
+    if "status" in fields and fields["status"].lower() not in STATUSES:
+        return f'Статус задачи может быть только: {"/".join(STATUSES)}'
+    return None
+
+
+def validate_task_fields(
+    title: str | None,
+    category: str | None,
+    due_date: str | None,
+    priority: str | None,
+    status: str | None,
+) -> str | None:
+    """Проверка полей задачи по тем же правилам, что и у команды add
+
+    Args:
+        title (str | None): Название
+        category (str | None): Категория
+        due_date (str | None): Дедлайн год-месяц-день, None - по умолчанию
+        priority (str | None): Приоритет
+        status (str | None): Статус
+
+    Returns:
+        str | None: Текст ошибки или None, если все поля корректны
+    """
+    if not title:
+        return 'Для создания задачи небходимо указать "--title"'
+    if due_date:
+        try:
+            date_to_ordinal(due_date)
+        except ValueError:
+            return 'Дату необходимо указывать в формате год-месяц-день'
+    if category and category.lower() not in CATEGORIES:
+        return f'Категория должна быть одной из: {", ".join(CATEGORIES)}'
+    if priority and priority.lower() not in PRIORITIES:
+        return f'Приоритет должен быть одним из: {", ".join(PRIORITIES)}'
+    if status and status.lower() not in STATUSES:
+        return f'Статус должен быть одним из: {", ".join(STATUSES)}'
+    return None
+
+
 def answer_user_edit_info(task: Task, user_choice: int):
     if user_choice == 1:  # Название
         title = input("Введите новое название: ")
@@ -49,7 +171,7 @@ def answer_user_edit_info(task: Task, user_choice: int):
     
     elif user_choice == 5:  # Приоритет
         priority = input("Введите новый приоритет (низкий,средний,выскоий): ")
-        if priority.lower() not in ["низкий", "средний", "высокий"]:
+        if priority.lower() not in PRIORITIES:
             print("Сказано же - низкий, средний, высокий.")
             return
         task.priority = priority
@@ -84,7 +206,7 @@ def answer_user_edit_info(task: Task, user_choice: int):
         category = input("Введите новую категорию: ")
         priority = input("Введите новый приоритет (низкий,средний,выскоий): ")
 
-        if priority.lower() not in ["низкий", "средний", "высокий"]:
+        if priority.lower() not in PRIORITIES:
             print("Сказано же - низкий, средний, высокий.")
             return
 